@@ -9,6 +9,7 @@ from .models import (
     Order,
     User,
     Promocode,
+    IdempotencyKey,
 )
 
 admin.site.register(Product)
@@ -20,3 +21,4 @@ admin.site.register(Order)
 admin.site.register(OrderItem)
 admin.site.register(User)
 admin.site.register(Promocode)
+admin.site.register(IdempotencyKey)
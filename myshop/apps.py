@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MyshopConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "myshop"
+
+    def ready(self):
+        from . import autocomplete, cart, thumbnails  # noqa: F401 signals
+        from .search import restore_sqlite_triggers
+
+        post_migrate.connect(restore_sqlite_triggers, sender=self)
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+# Attributes of the user copied into its tokens, which permissions read
+ROLE_CLAIMS = ("is_supplier", "is_staff")
+
+
+class RoleClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Tokens of the djoser JWT endpoints, carrying the roles of the user.
+
+    Access tokens made by refreshing copy the claims of the refresh token,
+    so a changed role is seen once the user logs in again.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in ROLE_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+
+class RoleClaimsUser(TokenUser):
+    """User backed by the claims of a validated token, without a query"""
+
+    @cached_property
+    def id(self):
+        # Tokens store the id as a string, rows compare to integers
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def is_supplier(self):
+        return self.token["is_supplier"]
+
+    @cached_property
+    def is_staff(self):
+        return self.token["is_staff"]
+
+
+class RoleClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication trusting the role claims of tokens for reads.
+
+    Safe requests get a RoleClaimsUser, so they cost no user lookup. Other
+    requests save rows referencing the user and get the User row, as do
+    tokens issued before the roles were added to them.
+    """
+
+    def authenticate(self, request):
+        if request.method not in SAFE_METHODS:
+            return super().authenticate(request)
+
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        if all(claim in validated_token for claim in ROLE_CLAIMS):
+            return RoleClaimsUser(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+
+class RoleClaimsAuthenticationMixin:
+    """Authenticate requests to a view with RoleClaimsJWTAuthentication
+    when JWT_ROLE_CLAIMS is set.
+
+    Only views which read nothing of the user but its id and roles opt in,
+    others such as the djoser ones keep the default authentication.
+    """
+
+    def get_authenticators(self):
+        if settings.JWT_ROLE_CLAIMS:
+            return [RoleClaimsJWTAuthentication()]
+        return super().get_authenticators()
@@ -0,0 +1,230 @@
+import bisect
+import re
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Category, Product
+
+
+def normalize(text):
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+class PrefixIndex:
+    """Sorted array of title suffixes, searched by bisection.
+
+    A title is stored once per word, as the rest of the title from that
+    word on, e.g. "Iphone 13 Pro" is found by "iph", "13 p" and "pro". The
+    keys starting with a prefix form one range of the array, which is
+    ranked on the fly when short. Best entries of long ranges, i.e. of
+    short prefixes, are cached and kept up to date on add.
+    """
+
+    # Ranges up to this many keys are ranked on every lookup
+    scan_limit = 32
+
+    def __init__(self, limit):
+        self.limit = limit
+        # Sorted (suffix, id)
+        self.keys = []
+        # id -> (title, score)
+        self.entries = {}
+        # prefix -> best ids, best first
+        self.top = {}
+
+    @staticmethod
+    def _suffixes(title):
+        words = normalize(title)
+        starts = [0] + [i + 1 for i, char in enumerate(words) if char == " "]
+        return {words[start:] for start in starts}
+
+    def _rank(self, entry_id):
+        # Highest score first, then the oldest entry
+        return self.entries[entry_id][1], -entry_id
+
+    def _range(self, prefix):
+        return (
+            bisect.bisect_left(self.keys, (prefix,)),
+            bisect.bisect_left(self.keys, (prefix + "\U0010ffff",)),
+        )
+
+    def _best(self, ids, limit):
+        return sorted(set(ids), key=self._rank, reverse=True)[:limit]
+
+    def add(self, entry_id, title, score):
+        """Add entry or update its title and score"""
+        self.remove(entry_id)
+        self.entries[entry_id] = (title, score)
+        for suffix in self._suffixes(title):
+            bisect.insort(self.keys, (suffix, entry_id))
+            for end in range(1, len(suffix) + 1):
+                top = self.top.get(suffix[:end])
+                if top is not None:
+                    self.top[suffix[:end]] = self._best(
+                        top + [entry_id], self.limit
+                    )
+
+    def retitle(self, entry_id, title, score):
+        """Add entry with score, or change its title keeping its score"""
+        if entry_id in self.entries:
+            score = self.entries[entry_id][1]
+        self.add(entry_id, title, score)
+
+    def remove(self, entry_id):
+        if entry_id not in self.entries:
+            return
+        title, _ = self.entries.pop(entry_id)
+        for suffix in self._suffixes(title):
+            del self.keys[bisect.bisect_left(self.keys, (suffix, entry_id))]
+            for end in range(1, len(suffix) + 1):
+                if entry_id in self.top.get(suffix[:end], ()):
+                    # Ranked again from the whole range on next lookup
+                    del self.top[suffix[:end]]
+
+    def build(self, entries):
+        """Fill an empty index from (id, title, score)"""
+        for entry_id, title, score in entries:
+            self.entries[entry_id] = (title, score)
+            self.keys.extend(
+                (suffix, entry_id) for suffix in self._suffixes(title)
+            )
+        self.keys.sort()
+
+    def search(self, prefix, limit):
+        """Return [(id, title)] of the best entries matching prefix"""
+        prefix = normalize(prefix)
+        start, end = self._range(prefix)
+        if end - start <= self.scan_limit:
+            ids = self._best(
+                (entry_id for _, entry_id in self.keys[start:end]), limit
+            )
+        else:
+            top = self.top.get(prefix)
+            if top is None:
+                top = self.top[prefix] = self._best(
+                    (entry_id for _, entry_id in self.keys[start:end]),
+                    self.limit,
+                )
+            ids = top[:limit]
+        return [(entry_id, self.entries[entry_id][0]) for entry_id in ids]
+
+
+def product_score(rating, quantity_rates):
+    return float(rating), quantity_rates
+
+
+def build_indexes():
+    products = PrefixIndex(settings.AUTOCOMPLETE_LIMIT)
+    products.build(
+        (product_id, title, product_score(rating, quantity_rates))
+        for product_id, title, rating, quantity_rates in (
+            Product.objects.values_list(
+                "id", "title", "rating", "quantity_rates"
+            ).iterator()
+        )
+    )
+    categories = PrefixIndex(settings.AUTOCOMPLETE_LIMIT)
+    categories.build(
+        (category_id, title, (count,))
+        for category_id, title, count in Category.objects.annotate(
+            count=Count("category")
+        ).values_list("id", "title", "count")
+    )
+    return {"products": products, "categories": categories}
+
+
+# Every process keeps its own indexes. Signals keep them fresh for changes
+# made by the process, a periodic rebuild picks up everything else, like
+# other workers or F-expression updates of ratings.
+_lock = threading.RLock()
+_indexes = None
+_built_at = 0.0
+_rebuilding = False
+
+
+def reset():
+    """Drop the indexes, they are built again on next lookup"""
+    global _indexes
+    with _lock:
+        _indexes = None
+
+
+def _rebuild():
+    global _indexes, _built_at, _rebuilding
+    try:
+        indexes = build_indexes()
+        with _lock:
+            _indexes, _built_at = indexes, time.monotonic()
+    finally:
+        _rebuilding = False
+        connection.close()
+
+
+def get_indexes():
+    global _indexes, _built_at, _rebuilding
+    with _lock:
+        if _indexes is None:
+            _indexes, _built_at = build_indexes(), time.monotonic()
+        elif (
+            not _rebuilding
+            and time.monotonic() - _built_at
+            > settings.AUTOCOMPLETE_REBUILD_SECONDS
+        ):
+            # Serve the current indexes while the new ones are built
+            _rebuilding = True
+            threading.Thread(target=_rebuild, daemon=True).start()
+        return _indexes
+
+
+def autocomplete(prefix, limit):
+    indexes = get_indexes()
+    # Under the lock of _update, searches also fill the cached tops
+    with _lock:
+        return {
+            name: [
+                {"id": entry_id, "title": title}
+                for entry_id, title in index.search(prefix, limit)
+            ]
+            for name, index in indexes.items()
+        }
+
+
+def _update(name, method, *args):
+    def apply():
+        with _lock:
+            if _indexes is not None:
+                getattr(_indexes[name], method)(*args)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    _update(
+        "products",
+        "add",
+        instance.id,
+        instance.title,
+        product_score(instance.rating, instance.quantity_rates),
+    )
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    _update("products", "remove", instance.id)
+
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, **kwargs):
+    # A new category has no products, the product count of others is
+    # picked up by the periodic rebuild like the one of product changes
+    _update("categories", "retitle", instance.id, instance.title, (0,))
+
+
+@receiver(post_delete, sender=Category)
+def unindex_category(sender, instance, **kwargs):
+    _update("categories", "remove", instance.id)
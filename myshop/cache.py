@@ -0,0 +1,117 @@
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+# Cached responses are keyed on the generations of the scopes they depend
+# on. Invalidating a scope bumps its generation, which retires every
+# response built from it without having to know their keys.
+GENERATION_KEY = "catalog:generation:{}"
+RESPONSE_KEY = "catalog:response:{}"
+STATS_KEY = "catalog:stats:{}"
+
+
+def catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_generations(scopes):
+    cache = catalog_cache()
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def _bump_generations(scopes):
+    cache = catalog_cache()
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def invalidate(*scopes):
+    """Retire cached responses depending on any of scopes.
+
+    Generations are bumped right away and again when the current
+    transaction commits, so a response cached by a concurrent request
+    from rows read before the commit does not survive it.
+    """
+    _bump_generations(scopes)
+    transaction.on_commit(lambda: _bump_generations(scopes))
+
+
+def invalidate_products(*product_ids):
+    invalidate(
+        "products", *[f"product:{product_id}" for product_id in product_ids]
+    )
+
+
+def _count(event):
+    cache = catalog_cache()
+    key = STATS_KEY.format(event)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    cache = catalog_cache()
+    hits = cache.get(STATS_KEY.format("hits"), 0)
+    misses = cache.get(STATS_KEY.format("misses"), 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else None,
+    }
+
+
+def cache_response(*scopes):
+    """Cache successful responses of a view GET method.
+
+    Responses are keyed on the absolute URL of the request and the
+    generations of scopes, which are formatted with the URL kwargs of the
+    view, e.g. "product:{pk}".
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache = catalog_cache()
+            generations = get_generations(
+                [scope.format(**kwargs) for scope in scopes]
+            )
+            digest = hashlib.md5(
+                " ".join(
+                    [request.build_absolute_uri(), *map(str, generations)]
+                ).encode()
+            ).hexdigest()
+            key = RESPONSE_KEY.format(digest)
+
+            data = cache.get(key)
+            if data is not None:
+                _count("hits")
+                return Response(data)
+
+            _count("misses")
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+            return response
+
+        return wrapper
+
+    return decorator
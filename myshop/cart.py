@@ -0,0 +1,161 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .exceptions import UnknownProducts
+from .models import CartItem, Product
+from .querysets import cart_total
+from .serializers import CartSerializer
+
+# Carts are read on most page views and written rarely, so the serialized
+# cart of each user (items, unit prices and total) is kept in the cart
+# cache. CartItem rows stay the only source of truth:
+#
+# - cached carts are keyed on a generation of their user, and saving or
+#   deleting a row bumps it right away and again on commit, like catalog
+#   invalidation (see cache.invalidate);
+# - a read missing the cache builds the cart from CartItem under the
+#   generation it looked up first, so a cart built from rows read before
+#   a write commits is cached under a retired generation.
+#
+# So a user sees their own writes once committed. Writes skipping model
+# signals (QuerySet.update, bulk_create) must call invalidate_cart.
+CART_GENERATION_KEY = "cart:generation:{}"
+CART_KEY = "cart:{}:{}"
+
+
+def cart_cache():
+    return caches[settings.CART_CACHE_ALIAS]
+
+
+def build_cart(user_id):
+    cart_items = CartItem.objects.filter(user_id=user_id)
+    return CartSerializer(
+        {"products": cart_items, "total_price": cart_total(cart_items)}
+    ).data
+
+
+def get_generation(user_id):
+    cache = cart_cache()
+    key = CART_GENERATION_KEY.format(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_cart(user_id):
+    """Serialized cart of the user, two cache lookups when cached"""
+    cache = cart_cache()
+    key = CART_KEY.format(user_id, get_generation(user_id))
+    cart = cache.get(key)
+    if cart is None:
+        cart = build_cart(user_id)
+        cache.add(key, cart, settings.CART_CACHE_TIMEOUT)
+    return cart
+
+
+def _bump_generations(user_ids):
+    cache = cart_cache()
+    for user_id in user_ids:
+        key = CART_GENERATION_KEY.format(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def invalidate_cart(*user_ids):
+    """Retire cached carts of users now and when the transaction commits"""
+    _bump_generations(user_ids)
+    transaction.on_commit(lambda: _bump_generations(user_ids))
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    invalidate_cart(instance.user_id)
+
+
+def apply_cart_operations(user_id, operations):
+    """Apply operations to the cart of a user in one transaction.
+
+    operations are dicts of product id, op and quantity, applied in
+    order: "add" adds quantity to the item of the product, "set" replaces
+    its quantity and "remove" deletes it, as does a quantity of 0. Items
+    are locked, then written by one upsert and priced at the current
+    effective price of their product, like CartItem.save does.
+    """
+    product_ids = {operation["product"] for operation in operations}
+    prices = dict(
+        Product.objects.filter(pk__in=product_ids).values_list(
+            "pk", "effective_price"
+        )
+    )
+    unknown = sorted(product_ids - prices.keys())
+    if unknown:
+        raise UnknownProducts(unknown)
+
+    with transaction.atomic():
+        # Missing items are inserted first, so that every item is a row to
+        # lock and concurrent adds of a new product wait for each other
+        # instead of both upserting their own quantity
+        CartItem.objects.bulk_create(
+            [
+                CartItem(
+                    user_id=user_id,
+                    product_id=product_id,
+                    quantity=0,
+                    price=prices[product_id],
+                )
+                for product_id in product_ids
+            ],
+            ignore_conflicts=True,
+        )
+        quantities = dict(
+            CartItem.objects.select_for_update()
+            .filter(user_id=user_id, product__in=product_ids)
+            .values_list("product_id", "quantity")
+        )
+        for operation in operations:
+            product_id = operation["product"]
+            if operation["op"] == "add":
+                quantities[product_id] = (
+                    quantities.get(product_id, 0) + operation["quantity"]
+                )
+            elif operation["op"] == "set":
+                quantities[product_id] = operation["quantity"]
+            else:
+                quantities[product_id] = 0
+
+        items = [
+            CartItem(
+                user_id=user_id,
+                product_id=product_id,
+                quantity=quantity,
+                price=prices[product_id],
+            )
+            for product_id, quantity in quantities.items()
+            if quantity > 0
+        ]
+        if items:
+            CartItem.objects.bulk_create(
+                items,
+                update_conflicts=True,
+                unique_fields=["user", "product"],
+                update_fields=["quantity", "price"],
+            )
+        removed = [
+            product_id
+            for product_id, quantity in quantities.items()
+            if quantity == 0
+        ]
+        if removed:
+            CartItem.objects.filter(
+                user_id=user_id, product__in=removed
+            ).delete()
+        # bulk_create sends no signals
+        invalidate_cart(user_id)
@@ -0,0 +1,93 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+from django.db.models import Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from .models import CollectionRevision
+
+
+def row_validators(queryset, pk):
+    """Version and last modification date of one row, None if it is missing"""
+    updated_at = queryset.filter(pk=pk).values_list(
+        "updated_at", flat=True
+    ).first()
+    if updated_at is None:
+        return None
+    return updated_at.isoformat(), updated_at
+
+
+def collection_validators(queryset, name):
+    """Version and last modification date of all rows of queryset.
+
+    The date is the later of the last update of a row, read from the index
+    of updated_at, and the last deletion from the collection name (see
+    CollectionRevision), so deleting a row which was not the last modified
+    one changes both.
+    """
+    latest = queryset.order_by("-updated_at").values_list(
+        "updated_at", flat=True
+    )
+    dates = (
+        CollectionRevision.objects.filter(name=name)
+        .values_list("deleted_at", Subquery(latest[:1]))
+        .first()
+    )
+    if dates is None:
+        # Revisions are created by migrations and on the first deletion
+        dates = (None, latest.first())
+    known = [date for date in dates if date is not None]
+    last_modified = max(known) if known else None
+    version = " ".join(date.isoformat() if date else "" for date in dates)
+    return version, last_modified
+
+
+def conditional_response(validators):
+    """Answer conditional GET requests to a view method with 304.
+
+    validators(request, **kwargs) returns (version, last_modified) of the
+    resource, or None to skip conditional handling. ETag is derived from
+    the version, the URL and the rendered media type of the response.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            result = validators(request, **kwargs)
+            if result is None:
+                return method(view, request, *args, **kwargs)
+
+            version, last_modified = result
+            etag = quote_etag(
+                hashlib.md5(
+                    " ".join(
+                        [
+                            request.get_full_path(),
+                            request.accepted_media_type or "",
+                            version,
+                        ]
+                    ).encode()
+                ).hexdigest()
+            )
+            timestamp = (
+                timegm(last_modified.utctimetuple()) if last_modified else None
+            )
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+            if response.status_code in (
+                status.HTTP_200_OK,
+                status.HTTP_304_NOT_MODIFIED,
+            ):
+                response["ETag"] = etag
+                if timestamp is not None:
+                    response["Last-Modified"] = http_date(timestamp)
+            return response
+
+        return wrapper
+
+    return decorator
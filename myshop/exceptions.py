@@ -0,0 +1,34 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class CartChanged(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Cart items were changed during checkout, try again."
+    default_code = "cart_changed"
+
+
+class ProductSoldOut(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Not enough products in stock."
+    default_code = "sold_out"
+
+    def __init__(self, products):
+        super().__init__()
+        self.detail = {"detail": self.detail, "products": products}
+
+
+class UnknownProducts(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "Some products do not exist."
+    default_code = "unknown_products"
+
+    def __init__(self, products):
+        super().__init__()
+        self.detail = {"detail": self.detail, "products": products}
+
+
+class EmptyCheckout(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "None of the cart items were found."
+    default_code = "empty_checkout"
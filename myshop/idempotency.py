@@ -0,0 +1,92 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+
+
+def get_idempotency_key(request):
+    """Return the Idempotency-Key header of request, or None if not sent"""
+    return request.headers.get(IDEMPOTENCY_HEADER)
+
+
+def is_valid_key(key):
+    return 0 < len(key) <= MAX_KEY_LENGTH
+
+
+def request_hash(request):
+    """Fingerprint of request body, to detect a key reused for other data"""
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def stored_response(request, key):
+    """Return the stored response for key if it has not expired yet"""
+    stored = IdempotencyKey.objects.filter(
+        user=request.user,
+        key=key,
+        creation_date__gte=timezone.now() - settings.IDEMPOTENCY_KEY_TTL,
+    ).first()
+    if stored is None:
+        return None
+    if stored.request_hash != request_hash(request):
+        return Response(
+            {"detail": "Idempotency-Key was used for another request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(stored.response_data, status=stored.response_status)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def claim_key(request, key):
+    """Insert the row of key, to be filled by store_response.
+
+    Must be the first write of the request transaction. A concurrent
+    retry with the same key then blocks on the unique index until this
+    transaction ends, and fails with IntegrityError if it committed, so
+    the retry can replay the stored response instead of running again.
+    """
+    # An expired row would hold the key until the periodic eviction
+    IdempotencyKey.objects.filter(
+        user=request.user,
+        key=key,
+        creation_date__lt=timezone.now() - settings.IDEMPOTENCY_KEY_TTL,
+    ).delete()
+    return IdempotencyKey.objects.create(
+        user=request.user,
+        key=key,
+        request_hash=request_hash(request),
+        response_status=0,
+        response_data={},
+    )
+
+
+def store_response(claimed, response_status, response_data):
+    """Save the response in the row of a claimed key.
+
+    Must run in the transaction of the request, so the key and the
+    objects it created are committed or rolled back together.
+    """
+    claimed.response_status = response_status
+    claimed.response_data = response_data
+    claimed.save(update_fields=["response_status", "response_data"])
+
+
+def delete_expired_keys(batch_size=1000):
+    """Delete expired keys in batches, return how many were deleted"""
+    expired = IdempotencyKey.objects.filter(
+        creation_date__lt=timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+    )
+    deleted = 0
+    while True:
+        batch = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
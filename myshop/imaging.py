@@ -0,0 +1,50 @@
+import io
+from PIL import Image, ImageOps
+
+# Only depends on Pillow, so process pool workers can import it without
+# setting up Django.
+
+
+def render_variants(data, sizes, quality):
+    """Resize image data to fit each of sizes ({name: max side}).
+
+    Returns {name: WebP data}. Variants are never upscaled.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            alpha = "A" in image.getbands() or "transparency" in image.info
+            image = image.convert("RGBA" if alpha else "RGB")
+        variants = {}
+        for name, size in sizes.items():
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            output = io.BytesIO()
+            variant.save(output, "WEBP", quality=quality, method=4)
+            variants[name] = output.getvalue()
+        return variants
+
+
+def verify_image(file):
+    """Check that file (a path or a file object) is a complete image.
+
+    Returns its format, raises an error of Pillow or OSError otherwise.
+    """
+    with Image.open(file) as image:
+        image.verify()
+        return image.format
+
+
+# Extensions of the usual picture formats, others get the first extension
+# Pillow registered for them.
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+
+
+def format_extension(format):
+    """File extension for a format returned by verify_image"""
+    if format in EXTENSIONS:
+        return EXTENSIONS[format]
+    for extension, name in Image.registered_extensions().items():
+        if name == format:
+            return extension
+    return ""
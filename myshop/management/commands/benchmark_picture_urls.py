@@ -0,0 +1,65 @@
+import timeit
+from decouple import config
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+from myshop.models import ProductPicture
+from myshop.serializers import PictureSerializer
+from myshop.storage import picture_storage
+
+
+class StoragePictureSerializer(PictureSerializer):
+    """PictureSerializer building URLs through decouple and the storages"""
+
+    picture = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
+
+    def get_picture(self, obj):
+        return config("DOMEN") + obj.picture.url
+
+    def get_variants(self, obj):
+        return {
+            variant: config("DOMEN") + picture_storage.url(name)
+            for variant, name in obj.variants.items()
+        }
+
+
+def unsaved_pictures(count):
+    return [
+        ProductPicture(
+            id=picture_id,
+            product_id=1,
+            picture=f"images/products/ab/cd/{picture_id:064x}.jpg",
+            variants={
+                "thumbnail": f"images/products/{picture_id}_thumbnail.webp",
+                "medium": f"images/products/{picture_id}_medium.webp",
+            },
+        )
+        for picture_id in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Compare building picture URLs through storages and MediaURLField"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pictures", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        pictures = unsaved_pictures(options["pictures"])
+        results = {}
+        for serializer in (StoragePictureSerializer, PictureSerializer):
+            name = serializer.__name__
+            seconds = min(
+                timeit.repeat(
+                    lambda: serializer(pictures, many=True).data,
+                    number=1,
+                    repeat=options["repeat"],
+                )
+            )
+            results[name] = seconds
+            self.stdout.write(f"{name}: {seconds * 1000:.2f} ms")
+        speedup = (
+            results["StoragePictureSerializer"] / results["PictureSerializer"]
+        )
+        self.stdout.write(f"Speedup: {speedup:.1f}x")
@@ -0,0 +1,69 @@
+import timeit
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from myshop.renderers import ORJSONRenderer
+
+
+def product_list_payload(products, pictures):
+    """Payload shaped like a page of ProductsListView results"""
+    return {
+        "next": "http://127.0.0.1:8000/api/v1/products/?cursor=cD0yMDIx",
+        "previous": None,
+        "results": [
+            {
+                "id": product_id,
+                "pictures": [
+                    {
+                        "id": product_id * pictures + picture_id,
+                        "picture": (
+                            "http://127.0.0.1:8000/media/images/products/"
+                            f"2021/08/04/{product_id}_{picture_id}.jpg"
+                        ),
+                        "product": product_id,
+                    }
+                    for picture_id in range(pictures)
+                ],
+                "title": f"Product {product_id}",
+                "description": "Description of product " * 10,
+                "creation_date": "2021-08-04 18:52:00.123456",
+                "price": "12345.00",
+                "discount": 10,
+                "rating": "4.50",
+                "stock": 100,
+                "category": 1,
+                "user": 1,
+            }
+            for product_id in range(products)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare JSONRenderer and ORJSONRenderer on a product list"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--pictures", type=int, default=3)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = product_list_payload(options["products"], options["pictures"])
+        results = {}
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            name = type(renderer).__name__
+            size = len(renderer.render(data))
+            seconds = min(
+                timeit.repeat(
+                    lambda: renderer.render(data),
+                    number=1,
+                    repeat=options["repeat"],
+                )
+            )
+            results[name] = seconds
+            self.stdout.write(
+                f"{name}: {seconds * 1000:.2f} ms, {size} bytes"
+            )
+        self.stdout.write(
+            "Speedup: "
+            f"{results['JSONRenderer'] / results['ORJSONRenderer']:.1f}x"
+        )
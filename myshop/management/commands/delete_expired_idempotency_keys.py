@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from myshop.idempotency import delete_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored checkout responses older than IDEMPOTENCY_KEY_TTL"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of keys deleted per query",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        deleted = delete_expired_keys(options["batch_size"])
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from myshop.thumbnails import delete_unreferenced_files
+
+
+class Command(BaseCommand):
+    help = "Delete product picture files which no picture references"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=24 * 60 * 60,
+            help="Seconds since a file was last saved before it is deleted",
+        )
+
+    def handle(self, *args, **options):
+        if options["min_age"] < 0:
+            raise CommandError("--min-age must not be negative")
+        deleted = delete_unreferenced_files(options["min_age"])
+        self.stdout.write(f"Deleted {deleted} unreferenced picture files")
@@ -0,0 +1,30 @@
+from concurrent.futures import wait
+from django.core.management.base import BaseCommand
+from myshop.models import ProductPicture
+from myshop.thumbnails import schedule_variants
+
+
+class Command(BaseCommand):
+    help = "Generate resized variants of product pictures"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Also regenerate pictures which already have variants",
+        )
+
+    def handle(self, *args, **options):
+        pictures = ProductPicture.objects.exclude(picture="")
+        if not options["all"]:
+            pictures = pictures.filter(variants={})
+        futures = [
+            schedule_variants(picture_id, reuse=not options["all"])
+            for picture_id in pictures.values_list("id", flat=True)
+        ]
+        done, _ = wait(futures)
+        failed = sum(not future.result() for future in done)
+        self.stdout.write(
+            f"Generated variants of {len(futures) - failed} pictures, "
+            f"{failed} failed"
+        )
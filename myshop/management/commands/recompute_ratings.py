@@ -0,0 +1,141 @@
+import time
+from datetime import datetime, time as day_start
+from decimal import Decimal, ROUND_HALF_UP
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from myshop.cache import invalidate_products
+from myshop.models import Comment, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute rating, quantity_rates and rates_sum of products "
+        "from their comments"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help=(
+                "Only recompute products commented at or after this date "
+                "or datetime (ISO 8601)"
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of products read and written per query",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        started = time.monotonic()
+        rates = Comment.objects.filter(
+            comment_of_reply=None, rate__isnull=False
+        )
+        products = Product.objects.only(
+            "id", "rating", "quantity_rates", "rates_sum", "updated_at"
+        )
+        if options["since"]:
+            commented = Comment.objects.filter(
+                creation_date__gte=self.parse_since(options["since"])
+            ).values("product")
+            rates = rates.filter(product__in=commented)
+            products = products.filter(pk__in=commented)
+
+        # Each batch is recomputed with its product rows locked. Comments
+        # are written in the transaction of their change_product_rating
+        # (see Comment.save), so a rate change committed meanwhile is
+        # either counted by the aggregate or applied on top of the written
+        # counters.
+        scanned = updated = rates_count = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    products.select_for_update()
+                    .filter(pk__gt=last_pk)
+                    .order_by("pk")[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                scanned += len(batch)
+                totals = {
+                    row["product"]: (row["count"], row["total"])
+                    for row in rates.filter(
+                        product__in=[product.pk for product in batch]
+                    )
+                    .order_by()
+                    .values("product")
+                    .annotate(count=Count("rate"), total=Sum("rate"))
+                }
+                rates_count += sum(count for count, _ in totals.values())
+                changed = [
+                    product
+                    for product in batch
+                    if self.recompute(product, totals)
+                ]
+                if changed:
+                    now = timezone.now()
+                    for product in changed:
+                        product.updated_at = now
+                    Product.objects.bulk_update(
+                        changed,
+                        [
+                            "rating",
+                            "quantity_rates",
+                            "rates_sum",
+                            "updated_at",
+                        ],
+                    )
+                    invalidate_products(*[product.pk for product in changed])
+                    updated += len(changed)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Recomputed {scanned} products from {rates_count} rates "
+            f"in {elapsed:.2f}s "
+            f"({scanned / elapsed if elapsed else scanned:.0f} products/s), "
+            f"{updated} updated"
+        )
+
+    @staticmethod
+    def recompute(product, totals):
+        """Set counters of product from totals, return True if they changed"""
+        quantity_rates, rates_sum = totals.get(product.pk, (0, 0))
+        rating = Decimal(0)
+        if quantity_rates:
+            rating = (Decimal(rates_sum) / quantity_rates).quantize(
+                Decimal("0.01"), rounding=ROUND_HALF_UP
+            )
+        if (product.rating, product.quantity_rates, product.rates_sum) == (
+            rating,
+            quantity_rates,
+            rates_sum,
+        ):
+            return False
+        product.rating = rating
+        product.quantity_rates = quantity_rates
+        product.rates_sum = rates_sum
+        return True
+
+    @staticmethod
+    def parse_since(value):
+        try:
+            since = parse_datetime(value)
+            if since is None:
+                date = parse_date(value)
+                since = date and datetime.combine(date, day_start.min)
+        except ValueError:
+            since = None
+        if since is None:
+            raise CommandError(f"Invalid --since value: {value}")
+        return since
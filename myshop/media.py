@@ -0,0 +1,43 @@
+import mimetypes
+import posixpath
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.static import serve
+
+# Media is served by nginx when MEDIA_SERVING is "nginx": Django only
+# checks the path and answers with an X-Accel-Redirect to an internal
+# nginx location, which sends the file without holding a gunicorn worker.
+MEDIA_SERVING_DJANGO = "django"
+MEDIA_SERVING_NGINX = "nginx"
+
+
+def media_path(path):
+    """Return path normalized if it may be served, raise Http404 if not.
+
+    MEDIA_ROOT is the project directory, so only MEDIA_PUBLIC_DIRS are
+    ever served.
+    """
+    path = posixpath.normpath(path).lstrip("/")
+    if path.startswith("..") or not any(
+        path.startswith(directory) for directory in settings.MEDIA_PUBLIC_DIRS
+    ):
+        raise Http404("Media file not found.")
+    return path
+
+
+def serve_media(request, path):
+    path = media_path(path)
+    if settings.MEDIA_SERVING != MEDIA_SERVING_NGINX:
+        # Like django.conf.urls.static, only meant for development
+        if not settings.DEBUG:
+            raise Http404("Media file not found.")
+        return serve(request, path, document_root=settings.MEDIA_ROOT)
+
+    content_type, encoding = mimetypes.guess_type(path)
+    response = HttpResponse(
+        content_type=content_type or "application/octet-stream"
+    )
+    if encoding:
+        response["Content-Encoding"] = encoding
+    response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX + path
+    return response
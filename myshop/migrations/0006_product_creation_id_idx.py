@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0005_auto_20210804_1852'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(
+                fields=['-creation_date', '-id'],
+                name='product_creation_id_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_comment_threads(apps, schema_editor):
+    Comment = apps.get_model("myshop", "Comment")
+    threads = {}
+    changed = []
+    comments = Comment.objects.only("id", "comment_of_reply_id").order_by("id")
+    for comment in comments.iterator():
+        parent = threads.get(comment.comment_of_reply_id)
+        if parent is None:
+            threads[comment.id] = (comment.id, 0)
+            continue
+        comment.thread_root_id = parent[0]
+        comment.depth = parent[1] + 1
+        threads[comment.id] = (comment.thread_root_id, comment.depth)
+        changed.append(comment)
+    Comment.objects.bulk_update(
+        changed, ["thread_root", "depth"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0006_product_creation_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread_root',
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='thread_comments',
+                to='myshop.comment',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(
+                fields=['product', 'creation_date', 'id'],
+                name='comment_product_creation_idx',
+            ),
+        ),
+        migrations.RunPython(fill_comment_threads, migrations.RunPython.noop),
+    ]
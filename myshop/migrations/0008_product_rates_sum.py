@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:27
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+
+def fill_rates_sum(apps, schema_editor):
+    Product = apps.get_model("myshop", "Product")
+    Comment = apps.get_model("myshop", "Comment")
+    rates = (
+        Comment.objects.filter(
+            product=OuterRef("pk"),
+            comment_of_reply=None,
+            rate__isnull=False,
+        )
+        .order_by()
+        .values("product")
+    )
+    quantity_rates = Coalesce(
+        Subquery(rates.annotate(count=Count("rate")).values("count")),
+        Value(0),
+    )
+    rates_sum = Coalesce(
+        Subquery(rates.annotate(total=Sum("rate")).values("total")),
+        Value(0),
+    )
+    Product.objects.update(
+        quantity_rates=quantity_rates,
+        rates_sum=rates_sum,
+        rating=Coalesce(
+            Round(
+                Cast(rates_sum, FloatField()) / NullIf(quantity_rates, 0), 2
+            ),
+            Value(0.0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0007_comment_thread'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rates_sum',
+            field=models.IntegerField(
+                default=0,
+                validators=[django.core.validators.MinValueValidator(0)],
+            ),
+        ),
+        migrations.RunPython(fill_rates_sum, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0012_product_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(
+                fields=['category', '-creation_date', '-id'],
+                name='product_category_creation_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(
+                fields=['price', 'id'],
+                name='product_price_id_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(
+                fields=['rating', 'id'],
+                name='product_rating_id_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(
+                condition=models.Q(('discount__gt', 0)),
+                fields=['-creation_date', '-id'],
+                name='product_on_sale_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+def fill_effective_price(apps, schema_editor):
+    Product = apps.get_model("myshop", "Product")
+    products = Product.objects.only("id", "price", "discount").order_by("id")
+    last_id = 0
+    while True:
+        batch = list(products.filter(id__gt=last_id)[:1000])
+        if not batch:
+            break
+        for product in batch:
+            product.effective_price = (
+                product.price * (100 - product.discount) / 100
+            ).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        Product.objects.bulk_update(batch, ["effective_price"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0013_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_price_id_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                editable=False,
+                max_digits=10,
+            ),
+        ),
+        migrations.RunPython(fill_effective_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(
+                fields=['effective_price', 'id'],
+                name='product_effective_price_idx',
+            ),
+        ),
+    ]
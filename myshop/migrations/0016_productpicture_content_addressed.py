@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:57
+
+import myshop.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0015_productpicture_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productpicture',
+            name='picture',
+            field=models.ImageField(
+                blank=True,
+                db_index=True,
+                storage=myshop.storage.ContentAddressedStorage(),
+                upload_to='images/products',
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """Keep the first item of each product in a cart, with the quantity of
+    all of them
+    """
+    CartItem = apps.get_model('myshop', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('user', 'product')
+        .annotate(count=Count('id'), first=Min('id'), total=Sum('quantity'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        items = CartItem.objects.filter(
+            user=duplicate['user'], product=duplicate['product']
+        )
+        items.exclude(id=duplicate['first']).delete()
+        items.update(quantity=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0016_productpicture_content_addressed'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_cart_items, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'product'),
+                name='cart_item_user_product_uniq',
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def round_rating(apps, schema_editor):
+    # SQLite kept the unrounded averages written by change_product_rating
+    Product = apps.get_model("myshop", "Product")
+    Product.objects.update(rating=Round(F("rating"), 2))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0017_cartitem_user_product_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(round_rating, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+def create_revisions(apps, schema_editor):
+    CollectionRevision = apps.get_model('myshop', 'CollectionRevision')
+    CollectionRevision.objects.bulk_create(
+        [
+            CollectionRevision(name='products'),
+            CollectionRevision(name='categories'),
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myshop', '0018_round_product_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionRevision',
+            fields=[
+                (
+                    'name',
+                    models.CharField(
+                        max_length=50, primary_key=True, serialize=False
+                    ),
+                ),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_revisions, migrations.RunPython.noop),
+    ]
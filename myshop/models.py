@@ -1,9 +1,16 @@
-from django.db import models
+from decimal import Decimal, ROUND_HALF_UP
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib.auth.models import AbstractUser
 from django.db.models import signals
 from django.dispatch import receiver
 from django.conf import settings
+from django.utils import timezone
+from .cache import invalidate, invalidate_products
+from .storage import PICTURES_DIR, picture_storage
 
 
 class User(AbstractUser):
@@ -16,6 +23,7 @@ class Category(models.Model):
 
     title = models.CharField(verbose_name="Title", max_length=50, unique=True)
     description = models.CharField(verbose_name="Description", max_length=200)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -24,6 +32,13 @@ class Category(models.Model):
         return self.title
 
 
+@receiver(signals.post_save, sender=Category)
+@receiver(signals.post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    """Drop cached category responses when category is changed"""
+    invalidate("categories", f"category:{instance.id}")
+
+
 class Product(models.Model):
     """Product in shop"""
 
@@ -36,6 +51,10 @@ class Product(models.Model):
     discount = models.IntegerField(
         default=0, validators=[MaxValueValidator(100), MinValueValidator(0)]
     )
+    # Price with discount, kept in sync by set_effective_price
+    effective_price = models.DecimalField(
+        default=0, max_digits=10, decimal_places=2, editable=False
+    )
     category = models.ForeignKey(
         Category, related_name="category", on_delete=models.CASCADE
     )
@@ -54,11 +73,97 @@ class Product(models.Model):
     quantity_rates = models.IntegerField(
         default=0, validators=[MinValueValidator(0)]
     )
+    rates_sum = models.IntegerField(
+        default=0, validators=[MinValueValidator(0)]
+    )
+    # Items left in stock, null if stock of product is not tracked
+    stock = models.PositiveIntegerField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-creation_date", "-id"],
+                name="product_creation_id_idx",
+            ),
+            models.Index(
+                fields=["category", "-creation_date", "-id"],
+                name="product_category_creation_idx",
+            ),
+            models.Index(
+                fields=["effective_price", "id"],
+                name="product_effective_price_idx",
+            ),
+            models.Index(
+                fields=["rating", "id"], name="product_rating_id_idx"
+            ),
+            models.Index(
+                fields=["-creation_date", "-id"],
+                condition=Q(discount__gt=0),
+                name="product_on_sale_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
 
+def reserve_stock(quantities):
+    """Take quantities ({product id: quantity}) out of stock.
+
+    All products are reserved by one conditional UPDATE, so no row is read
+    or locked before it is written. Call it at the end of the checkout
+    transaction to hold the row locks as briefly as possible. Returns ids
+    of products that do not have enough stock, the caller must roll back
+    the transaction if there are any.
+    """
+    quantity = Case(
+        *[
+            When(pk=product_id, then=Value(quantity))
+            for product_id, quantity in quantities.items()
+        ],
+        output_field=models.IntegerField(),
+    )
+    with transaction.atomic():
+        reserved = Product.objects.filter(
+            Q(stock__isnull=True) | Q(stock__gte=quantity),
+            pk__in=quantities,
+        ).update(
+            stock=F("stock") - quantity, updated_at=timezone.now()
+        )
+        if reserved == len(quantities):
+            invalidate_products(*quantities)
+            return []
+        transaction.set_rollback(True)
+
+    in_stock = Product.objects.filter(
+        Q(stock__isnull=True) | Q(stock__gte=quantity),
+        pk__in=quantities,
+    ).values_list("id", flat=True)
+    return sorted(set(quantities) - set(in_stock))
+
+
+def effective_price(price, discount):
+    """Price with discount percent taken off, rounded to cents"""
+    return (Decimal(price) * (100 - discount) / 100).quantize(
+        Decimal("0.01"), rounding=ROUND_HALF_UP
+    )
+
+
+@receiver(signals.pre_save, sender=Product)
+def set_effective_price(sender, instance, **kwargs):
+    instance.effective_price = effective_price(
+        instance.price, instance.discount
+    )
+
+
+@receiver(signals.post_save, sender=Product)
+@receiver(signals.post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    """Drop cached product responses when product is changed"""
+    invalidate_products(instance.id)
+
+
 class ProductPicture(models.Model):
     """Pictures of product"""
 
@@ -66,8 +171,24 @@ class ProductPicture(models.Model):
         Product, related_name="pictures", on_delete=models.CASCADE
     )
     picture = models.ImageField(
-        upload_to="images/products/%Y/%m/%d", blank=True
+        upload_to=PICTURES_DIR,
+        storage=picture_storage,
+        blank=True,
+        db_index=True,
+    )
+    # Resized copies of picture ({variant: file name}), see thumbnails.py
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+@receiver(signals.post_save, sender=ProductPicture)
+@receiver(signals.post_delete, sender=ProductPicture)
+def invalidate_picture_cache(sender, instance, **kwargs):
+    """Drop cached product responses when its pictures are changed"""
+    Product.objects.filter(pk=instance.product_id).update(
+        updated_at=timezone.now()
     )
+    invalidate_products(instance.product_id)
 
 
 class Comment(models.Model):
@@ -99,30 +220,113 @@ class Comment(models.Model):
         blank=True,
         on_delete=models.CASCADE,
     )
+    thread_root = models.ForeignKey(
+        "self",
+        related_name="thread_comments",
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.CASCADE,
+    )
+    depth = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["product", "creation_date", "id"],
+                name="comment_product_creation_idx",
+            ),
+        ]
+
+    # Rate stored in the database, used to apply rating deltas on save
+    _loaded_rate = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rate = instance.__dict__.get("rate")
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The row and the rating delta of its post_save commit together, so
+        # recompute_ratings never counts the rate and then gets its delta
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.id} {self.user} {self.product}"
 
 
 @receiver(signals.pre_save, sender=Comment)
-def update_product_rate(sender, instance, **kwargs):
-    """Update product rating when added or changed rate in comments"""
-    if instance.comment_of_reply:
-        pass
-    elif instance.id:
-        old_comment = Comment.objects.get(pk=instance.id)
-        instance.product.rating = (
-            (instance.product.rating * instance.product.quantity_rates)
-            + instance.rate
-            - old_comment.rate
-        ) / instance.product.quantity_rates
+def set_comment_thread(sender, instance, **kwargs):
+    """Store thread root and depth so a whole thread is read in one query"""
+    parent = instance.comment_of_reply
+    if parent is None:
+        instance.thread_root = None
+        instance.depth = 0
     else:
-        instance.product.quantity_rates += 1
-        instance.product.rating = (
-            (instance.product.rating * (instance.product.quantity_rates - 1))
-            + instance.rate
-        ) / instance.product.quantity_rates
-    instance.product.save()
+        instance.thread_root_id = parent.thread_root_id or parent.id
+        instance.depth = parent.depth + 1
+
+
+def change_product_rating(product_id, old_rate, new_rate):
+    """Move product rating from old_rate to new_rate with a single UPDATE.
+
+    Counters are changed by the database, so concurrent comments never
+    overwrite each other and no other product columns are written.
+    """
+    rates_delta = (new_rate is not None) - (old_rate is not None)
+    sum_delta = (new_rate or 0) - (old_rate or 0)
+    if not rates_delta and not sum_delta:
+        return False
+
+    quantity_rates = F("quantity_rates") + rates_delta
+    rates_sum = F("rates_sum") + sum_delta
+    Product.objects.filter(pk=product_id).update(
+        updated_at=timezone.now(),
+        quantity_rates=quantity_rates,
+        rates_sum=rates_sum,
+        # Rounded like the column, so SQLite stores what is serialized
+        rating=Coalesce(
+            Round(
+                Cast(rates_sum, FloatField()) / NullIf(quantity_rates, 0), 2
+            ),
+            Value(0.0),
+        ),
+    )
+    invalidate_products(product_id)
+    return True
+
+
+def _sync_product_rating(comment):
+    if Comment.product.is_cached(comment):
+        comment.product.refresh_from_db(
+            fields=["rating", "quantity_rates", "rates_sum"]
+        )
+
+
+@receiver(signals.post_save, sender=Comment)
+def update_product_rate(sender, instance, created, **kwargs):
+    """Update product rating when added or changed rate in comments"""
+    old_rate = None if created else instance._loaded_rate
+    instance._loaded_rate = instance.rate
+    if instance.comment_of_reply_id:
+        return
+    if change_product_rating(instance.product_id, old_rate, instance.rate):
+        _sync_product_rating(instance)
+
+
+@receiver(signals.post_delete, sender=Comment)
+def remove_product_rate(sender, instance, **kwargs):
+    """Update product rating when comment with rate is deleted"""
+    if instance.comment_of_reply_id:
+        return
+    if change_product_rating(instance.product_id, instance._loaded_rate, None):
+        _sync_product_rating(instance)
 
 
 class CartItem(models.Model):
@@ -142,15 +346,21 @@ class CartItem(models.Model):
     price = models.DecimalField(blank=True,
         max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
 
+    class Meta:
+        constraints = [
+            # One item per product, adding a product again adds quantity
+            models.UniqueConstraint(
+                fields=["user", "product"], name="cart_item_user_product_uniq"
+            ),
+        ]
+
     def __str__(self):
         return f"{self.id} {self.user} {self.product} - {self.quantity}"
 
 
 @receiver(signals.pre_save, sender=CartItem)
 def set_product_price(sender, instance, **kwargs):
-    instance.price = float(instance.product.price) - (
-        float(instance.product.price) * (instance.product.discount / 100)
-    )
+    instance.price = instance.product.effective_price
 
 
 class Order(models.Model):
@@ -207,3 +417,53 @@ class Promocode(models.Model):
 
     def __str__(self):
         return f"{self.code} - {self.discount}"
+
+
+class IdempotencyKey(models.Model):
+    """Response of a request sent with Idempotency-Key header"""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="idempotency_keys",
+        on_delete=models.CASCADE,
+    )
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField()
+    response_data = models.JSONField(encoder=DjangoJSONEncoder)
+    creation_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_user_idempotency_key"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.key} - {self.response_status}"
+
+
+class CollectionRevision(models.Model):
+    """Last deletion from a collection of rows, e.g. "products".
+
+    Deleting a row which was not the last modified one leaves the maximum
+    updated_at of the collection as it was, so conditional.py reads this
+    row as well to answer conditional GETs of collections.
+    """
+
+    name = models.CharField(max_length=50, primary_key=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.deleted_at}"
+
+
+@receiver(signals.post_delete, sender=Product)
+@receiver(signals.post_delete, sender=Category)
+def record_collection_deletion(sender, instance, **kwargs):
+    """Bump the revision of the collection in the deleting transaction"""
+    name = "products" if sender is Product else "categories"
+    CollectionRevision.objects.update_or_create(
+        name=name, defaults={"deleted_at": timezone.now()}
+    )
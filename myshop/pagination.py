@@ -0,0 +1,175 @@
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+# Values of the ordering query parameter of the product list
+PRODUCT_ORDERINGS = {
+    "-creation_date": ("-creation_date", "-id"),
+    "creation_date": ("creation_date", "id"),
+    "price": ("effective_price", "id"),
+    "-price": ("-effective_price", "-id"),
+    "rating": ("rating", "id"),
+    "-rating": ("-rating", "-id"),
+}
+
+
+class KeysetCursorPagination(CursorPagination):
+    """Keyset pagination by a (field, id) ordering.
+
+    The cursor holds both the field value, as the model field converts it
+    to and from a string, and the id of the edge row of the page, and the
+    next page is the rows after that pair. Ties on the
+    field are broken by id, so unlike CursorPagination it never falls
+    back to an offset, which is capped by offset_cutoff.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        field = self.ordering[0]
+        descending = field.startswith("-")
+        self.field = queryset.model._meta.get_field(field.lstrip("-"))
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor.reverse
+        if cursor is not None:
+            try:
+                value, pk = cursor.position.rsplit(" ", 1)
+                value = self.field.to_python(value)
+                after = "lt" if descending != reverse else "gt"
+                queryset = queryset.filter(
+                    Q(**{f"{self.field.name}__{after}": value})
+                    | Q(**{self.field.name: value, f"id__{after}": int(pk)})
+                )
+            except (AttributeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        if reverse:
+            queryset = queryset.order_by(
+                *(
+                    name[1:] if name.startswith("-") else f"-{name}"
+                    for name in self.ordering
+                )
+            )
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(
+                offset=0,
+                reverse=False,
+                position=self.get_position(self.page[-1]),
+            )
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(
+                offset=0,
+                reverse=True,
+                position=self.get_position(self.page[0]),
+            )
+        )
+
+    def get_position(self, instance):
+        # Through the model field, so the value parses back to the same one
+        return f"{self.field.value_to_string(instance)} {instance.pk}"
+
+
+class ProductCursorPagination(KeysetCursorPagination):
+    """Keyset pagination of products, newest first by default.
+
+    Every ordering has a matching (field, id) index to serve the
+    (field, id) > (value, pk) filter of the cursor.
+    """
+
+    ordering = PRODUCT_ORDERINGS["-creation_date"]
+    ordering_query_param = "ordering"
+    page_size = settings.PRODUCTS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.PRODUCTS_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        return PRODUCT_ORDERINGS.get(
+            request.query_params.get(self.ordering_query_param),
+            self.ordering,
+        )
+
+
+class CommentThreadCursorPagination(KeysetCursorPagination):
+    """Keyset pagination of top-level comments of a product, oldest first"""
+
+    ordering = ("creation_date", "id")
+    page_size = settings.COMMENTS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.COMMENTS_MAX_PAGE_SIZE
+
+
+class ProductSearchPagination(CursorPagination):
+    """Keyset pagination of search results by (rank, id).
+
+    The cursor holds the rank and id of the last result of the page, so
+    the next page is the range of matches after it rather than an offset
+    into them. The rank is kept as its str, search_products converts it
+    back to the exact value it compares to.
+    """
+
+    page_size = settings.PRODUCTS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.PRODUCTS_MAX_PAGE_SIZE
+
+    def paginate_search(self, search, request):
+        """Return the page of search(after, limit) for request"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        after = None
+        if cursor is not None:
+            try:
+                rank, pk = cursor.position.split(" ")
+                after = (rank, int(pk))
+                if not Decimal(rank).is_finite():
+                    raise ValueError(rank)
+            except (AttributeError, ValueError, InvalidOperation):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = search(after, self.page_size + 1)
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        rank, pk = self.page[-1]
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=f"{rank} {pk}")
+        )
+
+    def get_previous_link(self):
+        return None
@@ -1,3 +1,4 @@
+from django.db.models import Count, Q
 from rest_framework.permissions import (
     BasePermission,
     SAFE_METHODS,
@@ -5,20 +6,47 @@ from rest_framework.permissions import (
 )
 
 
+class QuerysetPermissionMixin:
+    """Check object permissions of many rows at once.
+
+    Permissions may define has_queryset_permission(request, view,
+    queryset), which must hold for every row of queryset, to be checked
+    without loading and checking each row.
+    """
+
+    def check_queryset_permissions(self, request, queryset):
+        for permission in self.get_permissions():
+            check = getattr(permission, "has_queryset_permission", None)
+            if check is not None and not check(request, self, queryset):
+                self.permission_denied(
+                    request,
+                    message=getattr(permission, "message", None),
+                    code=getattr(permission, "code", None),
+                )
+
+
 class OwnerPermission(BasePermission):
     message = "Only owner can post, patch or delete."
 
     def has_object_permission(self, request, view, obj):
         if request.method in SAFE_METHODS:
             return True
-        return obj.user == request.user
+        return obj.user_id == request.user.id
 
 
 class CartOwnerPermission(BasePermission):
     message = "Only owner can use this cart item."
 
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
+        return obj.user_id == request.user.id
+
+    def has_queryset_permission(self, request, view, queryset):
+        # One query however many rows, instead of a check per row
+        counts = queryset.aggregate(
+            total=Count("pk"),
+            owned=Count("pk", filter=Q(user_id=request.user.id)),
+        )
+        return counts["total"] == counts["owned"]
 
 
 class IsSupplierPermission(BasePermission):
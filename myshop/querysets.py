@@ -0,0 +1,185 @@
+from collections import Counter
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    F,
+    IntegerField,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+from .models import Comment
+
+
+def optimize_queryset(queryset, serializer_class):
+    """Join or prefetch every relation that serializer_class renders,
+    so serializing the queryset costs a constant number of queries
+    """
+    select_related, prefetch_related = related_lookups(serializer_class)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+def filter_products(queryset, filters):
+    """Apply validated ProductFilterSerializer data to queryset"""
+    if filters.get("category") is not None:
+        queryset = queryset.filter(category=filters["category"])
+    if filters.get("price_min") is not None:
+        queryset = queryset.filter(
+            effective_price__gte=filters["price_min"]
+        )
+    if filters.get("price_max") is not None:
+        queryset = queryset.filter(
+            effective_price__lte=filters["price_max"]
+        )
+    if filters.get("min_rating") is not None:
+        queryset = queryset.filter(rating__gte=filters["min_rating"])
+    if filters.get("on_sale"):
+        queryset = queryset.filter(discount__gt=0)
+    return queryset
+
+
+def product_facets(queryset):
+    """Count products of queryset per category and per price bucket.
+
+    Both facets come from one GROUP BY (category, bucket) query, then are
+    summed up separately. Buckets of effective_price are bounded by
+    PRODUCTS_PRICE_BUCKETS.
+    """
+    bounds = settings.PRODUCTS_PRICE_BUCKETS
+    bucket = Case(
+        *[
+            When(effective_price__lt=bound, then=Value(i))
+            for i, bound in enumerate(bounds)
+        ],
+        default=Value(len(bounds)),
+        output_field=IntegerField(),
+    )
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=bucket)
+        .values_list("category", "price_bucket")
+        .annotate(count=Count("id"))
+    )
+    categories, buckets = Counter(), Counter()
+    for category, price_bucket, count in rows:
+        categories[category] += count
+        buckets[price_bucket] += count
+
+    edges = [None, *bounds, None]
+    return {
+        "category": [
+            {"id": category, "count": count}
+            for category, count in sorted(
+                categories.items(), key=lambda item: (-item[1], item[0])
+            )
+        ],
+        "price": [
+            {"min": edges[i], "max": edges[i + 1], "count": buckets[i]}
+            for i in range(len(bounds) + 1)
+        ],
+    }
+
+
+def cart_total(queryset):
+    """Sum of price * quantity of cart items, as one aggregate query.
+
+    Returns a Decimal with cents, 0 for no items.
+    """
+    total = queryset.order_by().aggregate(
+        total=Coalesce(
+            Sum(F("price") * F("quantity")),
+            Value(Decimal(0)),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+    )["total"]
+    return total.quantize(Decimal("0.01"))
+
+
+def attach_comment_replies(roots, max_depth):
+    """Load the replies of all threads started by roots in one query and
+    attach them as thread_replies lists, skipping replies nested deeper
+    than max_depth
+    """
+    comments = {}
+    for root in roots:
+        root.thread_replies = []
+        comments[root.id] = root
+    if not comments or max_depth < 1:
+        return roots
+
+    replies = Comment.objects.filter(
+        thread_root__in=list(comments), depth__lte=max_depth
+    ).order_by("depth", "creation_date", "id")
+    for reply in replies:
+        reply.thread_replies = []
+        comments[reply.id] = reply
+        comments[reply.comment_of_reply_id].thread_replies.append(reply)
+    return roots
+
+
+@lru_cache(maxsize=None)
+def related_lookups(serializer_class):
+    """Return (select_related, prefetch_related) lookups of serializer_class"""
+    select_related, prefetch_related = [], []
+    _collect_lookups(
+        serializer_class(),
+        "",
+        False,
+        (serializer_class,),
+        select_related,
+        prefetch_related,
+    )
+    return tuple(select_related), tuple(prefetch_related)
+
+
+def _collect_lookups(
+    serializer, prefix, in_prefetch, seen, select_related, prefetch_related
+):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*":
+            continue
+        lookup = prefix + field.source.replace(".", "__")
+
+        if isinstance(field, serializers.ListSerializer):
+            prefetch_related.append(lookup)
+            child = field.child
+            if type(child) not in seen:
+                _collect_lookups(
+                    child,
+                    lookup + "__",
+                    True,
+                    seen + (type(child),),
+                    select_related,
+                    prefetch_related,
+                )
+        elif isinstance(field, serializers.BaseSerializer):
+            (prefetch_related if in_prefetch else select_related).append(
+                lookup
+            )
+            if type(field) not in seen:
+                _collect_lookups(
+                    field,
+                    lookup + "__",
+                    in_prefetch,
+                    seen + (type(field),),
+                    select_related,
+                    prefetch_related,
+                )
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetch_related.append(lookup)
+        elif isinstance(
+            field, serializers.RelatedField
+        ) and not field.use_pk_only_optimization():
+            (prefetch_related if in_prefetch else select_related).append(
+                lookup
+            )
@@ -0,0 +1,72 @@
+import datetime
+import decimal
+import orjson
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework import ISO_8601
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """Encode objects orjson does not know the way DRF's JSONEncoder does,
+    except datetimes, which follow REST_FRAMEWORK["DATETIME_FORMAT"] like
+    serializer fields do
+    """
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, datetime.datetime):
+        if api_settings.DATETIME_FORMAT.lower() == ISO_8601:
+            return _fallback_encoder.default(obj)
+        return obj.strftime(api_settings.DATETIME_FORMAT)
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    return _fallback_encoder.default(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """Drop-in replacement of JSONRenderer using orjson"""
+
+    media_type = "application/json"
+    format = "json"
+    charset = None
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    # The indent requested by the media type or the renderer context
+    get_indent = JSONRenderer.get_indent
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        options = self.options
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            # orjson only supports an indent of two spaces
+            options |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=_default, option=options)
+        # Keep the output a strict javascript subset, like JSONRenderer
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
+
+
+class ORJSONParser(BaseParser):
+    """Drop-in replacement of JSONParser using orjson"""
+
+    media_type = "application/json"
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
@@ -0,0 +1,187 @@
+import re
+from decimal import Decimal
+from django.db import connection, connections
+from django.db.models import Q
+from .models import Product
+
+# Full-text search over titles and descriptions of products.
+#
+# PostgreSQL matches against an expression GIN index over the tsvector of
+# both columns. SQLite, for local runs, matches against an FTS5 table with
+# the products table as external content, kept in sync by triggers. Other
+# backends fall back to a substring scan.
+SEARCH_CONFIG = "english"
+SEARCH_DOCUMENT = (
+    f"to_tsvector('{SEARCH_CONFIG}', "
+    "coalesce(title, '') || ' ' || coalesce(description, ''))"
+)
+
+POSTGRESQL_INSTALL = [
+    "CREATE INDEX IF NOT EXISTS myshop_product_search_idx "
+    f"ON myshop_product USING GIN ({SEARCH_DOCUMENT})",
+]
+POSTGRESQL_UNINSTALL = [
+    "DROP INDEX IF EXISTS myshop_product_search_idx",
+]
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS myshop_product_fts_insert
+    AFTER INSERT ON myshop_product BEGIN
+        INSERT INTO myshop_product_fts (rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS myshop_product_fts_delete
+    AFTER DELETE ON myshop_product BEGIN
+        INSERT INTO myshop_product_fts
+            (myshop_product_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS myshop_product_fts_update
+    AFTER UPDATE OF title, description ON myshop_product BEGIN
+        INSERT INTO myshop_product_fts
+            (myshop_product_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO myshop_product_fts (rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS myshop_product_fts USING fts5(
+        title, description, content='myshop_product', content_rowid='id'
+    )
+    """,
+    *SQLITE_TRIGGERS,
+    "INSERT INTO myshop_product_fts (myshop_product_fts) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS myshop_product_fts_insert",
+    "DROP TRIGGER IF EXISTS myshop_product_fts_delete",
+    "DROP TRIGGER IF EXISTS myshop_product_fts_update",
+    "DROP TABLE IF EXISTS myshop_product_fts",
+]
+
+
+def _execute(db, statements):
+    with db.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install_search_index(db):
+    if db.vendor == "postgresql":
+        _execute(db, POSTGRESQL_INSTALL)
+    elif db.vendor == "sqlite":
+        _execute(db, SQLITE_INSTALL)
+
+
+def uninstall_search_index(db):
+    if db.vendor == "postgresql":
+        _execute(db, POSTGRESQL_UNINSTALL)
+    elif db.vendor == "sqlite":
+        _execute(db, SQLITE_UNINSTALL)
+
+
+def restore_sqlite_triggers(using, **kwargs):
+    """post_migrate receiver.
+
+    SQLite migrations rebuild a table to alter it, which drops its
+    triggers, so the FTS5 table would silently go stale after any later
+    migration of products. Put the triggers back and reindex if so.
+    """
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return
+    with db.cursor() as cursor:
+        tables = db.introspection.table_names(cursor)
+        if "myshop_product_fts" not in tables:
+            return
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master "
+            "WHERE type = 'trigger' AND name LIKE 'myshop_product_fts_%'"
+        )
+        if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+            return
+    _execute(db, SQLITE_INSTALL[1:])
+
+
+def search_terms(query):
+    """Words of query, anything else is ignored"""
+    return re.findall(r"\w+", query.lower())
+
+
+def _postgresql_matches(terms):
+    # ts_rank is higher for better matches, negated to sort like bm25. It
+    # is a real, which is rounded to a numeric so that the rank of the
+    # cursor compares equal to the one of its row.
+    sql = f"""
+        SELECT rank, id FROM (
+            SELECT round((-ts_rank({SEARCH_DOCUMENT}, query))::numeric, 6)
+                AS rank, id
+            FROM myshop_product, plainto_tsquery('{SEARCH_CONFIG}', %s) query
+            WHERE {SEARCH_DOCUMENT} @@ query
+        ) matches
+    """
+    return sql, [" ".join(terms)]
+
+
+def _sqlite_matches(terms):
+    sql = """
+        SELECT rank, id FROM (
+            SELECT bm25(myshop_product_fts) AS rank, rowid AS id
+            FROM myshop_product_fts
+            WHERE myshop_product_fts MATCH %s
+        ) matches
+    """
+    # Quoted terms are plain strings to FTS5, not query syntax
+    return sql, [" ".join(f'"{term}"' for term in terms)]
+
+
+def search_products(query, after=None, limit=20):
+    """Return [(rank, product_id)] of products matching all words of query.
+
+    Best matches come first, i.e. rows are ordered by ascending rank then
+    id. after is the (rank, product_id) of the last row of the previous
+    page, so every page is a keyset range of the same query. Its rank is
+    the str of a returned one, which converts back to the exact value.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == "postgresql":
+        sql, params = _postgresql_matches(terms)
+        rank_type = Decimal
+    elif connection.vendor == "sqlite":
+        sql, params = _sqlite_matches(terms)
+        rank_type = float
+    else:
+        return _scan_products(terms, after, limit)
+
+    if after is not None:
+        rank = rank_type(after[0])
+        sql += " WHERE rank > %s OR (rank = %s AND id > %s)"
+        params += [rank, rank, after[1]]
+    sql += " ORDER BY rank, id LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(rank, product_id) for rank, product_id in cursor.fetchall()]
+
+
+def _scan_products(terms, after, limit):
+    products = Product.objects.all()
+    for term in terms:
+        products = products.filter(
+            Q(title__icontains=term) | Q(description__icontains=term)
+        )
+    if after is not None:
+        products = products.filter(id__gt=after[1])
+    ids = products.order_by("id").values_list("id", flat=True)[:limit]
+    return [(0.0, product_id) for product_id in ids]
@@ -1,3 +1,6 @@
+import re
+from django.conf import settings
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
 from .models import (
     Product,
@@ -9,30 +12,59 @@ from .models import (
     Order,
     Promocode,
 )
-from decouple import config
+from .pagination import PRODUCT_ORDERINGS
+from .uploads import invalid_pictures
+
+
+# Names of stored files which need no quoting in URLs, like hashed names
+URL_SAFE_NAME = re.compile(r"[A-Za-z0-9_./-]*")
+
+
+class MediaURLField(serializers.Field):
+    """Absolute URL of a stored file, given as a FieldFile or a name.
+
+    Joins MEDIA_BASE_URL and the quoted name, which is what the file
+    system storages return from url(), without going through them.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        name = getattr(value, "name", value)
+        if not name:
+            return None
+        if not URL_SAFE_NAME.fullmatch(name):
+            name = filepath_to_uri(name)
+        return settings.MEDIA_BASE_URL + name.lstrip("/")
 
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = "__all__"
+        exclude = ["updated_at"]
+
 
+class CommentThreadSerializer(serializers.ModelSerializer):
+    """Comment with replies attached in memory by attach_comment_replies"""
 
-class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        exclude = ["comment_of_reply"]
+        exclude = ["comment_of_reply", "thread_root", "depth"]
 
     def get_fields(self):
-        fields = super(CommentSerializer, self).get_fields()
-        fields["replies"] = CommentSerializer(many=True)
+        fields = super(CommentThreadSerializer, self).get_fields()
+        fields["replies"] = CommentThreadSerializer(
+            many=True, source="thread_replies"
+        )
         return fields
 
 
 class CommentDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        exclude = ["user", "product"]
+        exclude = ["user", "product", "thread_root", "depth"]
 
 
 class CommentPatchSerializer(serializers.ModelSerializer):
@@ -42,14 +74,34 @@ class CommentPatchSerializer(serializers.ModelSerializer):
 
 
 class PictureSerializer(serializers.ModelSerializer):
-    picture = serializers.SerializerMethodField()
-
-    def get_picture(self, obj):
-        return config("DOMEN") + obj.picture.url
+    picture = MediaURLField()
+    # URLs of the resized copies generated so far
+    variants = serializers.DictField(child=MediaURLField(), read_only=True)
 
     class Meta:
         model = ProductPicture
-        fields = "__all__"
+        exclude = ["updated_at"]
+
+
+class PictureUploadSerializer(serializers.Serializer):
+    """Files of a bulk picture upload"""
+
+    pictures = serializers.ListField(
+        child=serializers.FileField(), allow_empty=False
+    )
+
+    def validate_pictures(self, files):
+        if len(files) > settings.PICTURE_UPLOAD_MAX_FILES:
+            raise serializers.ValidationError(
+                "Ensure this field has no more than "
+                f"{settings.PICTURE_UPLOAD_MAX_FILES} elements."
+            )
+        invalid = invalid_pictures(files)
+        if invalid:
+            raise serializers.ValidationError(
+                {index: ["Upload a valid image."] for index in invalid}
+            )
+        return files
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -59,31 +111,78 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         exclude = [
             "quantity_rates",
+            "rates_sum",
+            "updated_at",
         ]
 
 
 class ProductCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ["title", "description", "price", "discount", "category"]
+        fields = [
+            "title",
+            "description",
+            "price",
+            "discount",
+            "category",
+            "stock",
+        ]
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    """Query parameters of the product list"""
+
+    category = serializers.IntegerField(required=False)
+    price_min = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, required=False
+    )
+    price_max = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, required=False
+    )
+    min_rating = serializers.FloatField(
+        min_value=0, max_value=5, required=False
+    )
+    on_sale = serializers.BooleanField(required=False)
+    ordering = serializers.ChoiceField(
+        choices=list(PRODUCT_ORDERINGS), required=False
+    )
+    facets = serializers.BooleanField(required=False)
+
+    def validate(self, data):
+        if (
+            data.get("price_min") is not None
+            and data.get("price_max") is not None
+            and data["price_min"] > data["price_max"]
+        ):
+            raise serializers.ValidationError(
+                "price_min must not be greater than price_max."
+            )
+        return data
 
 
 class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         exclude = ["user"]
+        # Adding nothing would leave no item to return
+        extra_kwargs = {"quantity": {"min_value": 1}}
 
 
 class CartSerializer(serializers.Serializer):
+    """Cart items with their total_price, given by querysets.cart_total"""
+
     products = CartItemSerializer(many=True)
-    total_price = serializers.SerializerMethodField()
+    total_price = serializers.ReadOnlyField()
+
 
-    def get_total_price(self, obj):
-        total_price = 0
-        for product in obj["products"]:
-            total_price += product.price * product.quantity
+class CartOperationSerializer(serializers.Serializer):
+    """One change of a bulk cart update, see cart.apply_cart_operations"""
 
-        return total_price
+    product = serializers.IntegerField()
+    op = serializers.ChoiceField(
+        choices=["add", "set", "remove"], default="add"
+    )
+    quantity = serializers.IntegerField(min_value=0, default=1)
 
 
 class CartPatchSerializer(serializers.ModelSerializer):
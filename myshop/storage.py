@@ -0,0 +1,94 @@
+import hashlib
+import os
+import uuid
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+# Product pictures are stored under the SHA-256 of their content, so the
+# same image uploaded to many products is saved once. Files no picture
+# references any more are removed out of band, by the
+# delete_unreferenced_pictures command.
+PICTURES_DIR = "images/products"
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploads to a temporary file, hashing them on the way.
+
+    The digest is kept as the sha256 attribute of the uploaded file, so
+    it does not have to be read again to find its content-addressed name.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hash.hexdigest()
+        return file
+
+
+def content_hash(file):
+    """SHA-256 of file, computed while uploading if possible"""
+    digest = getattr(file, "sha256", None)
+    if digest is None:
+        hash = hashlib.sha256()
+        file.seek(0)
+        for chunk in file.chunks():
+            hash.update(chunk)
+        file.seek(0)
+        digest = hash.hexdigest()
+    return digest
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Storage naming files after the SHA-256 of their content.
+
+    A file saved as "dir/name.jpg" is stored as "dir/ab/cd/abcd....jpg",
+    and saving the same content again returns the stored name without
+    writing anything, only refreshing its modification time so that it is
+    not collected as unreferenced meanwhile. Concurrent saves of the same
+    content write their own temporary file and atomically rename it, so
+    readers never see a partial file.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        directory, filename = os.path.split(name)
+        digest = content_hash(content)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        )
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        try:
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            pass
+        temporary = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def replace(self, name, content):
+        """Save content as name as is, replacing any file of that name.
+
+        For files named after a stored one, like the variants of a picture.
+        """
+        name = self.generate_filename(name)
+        temporary = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+picture_storage = ContentAddressedStorage()
@@ -0,0 +1,133 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from myshop.authentication import (
+    RoleClaimsJWTAuthentication,
+    RoleClaimsUser,
+)
+from myshop.models import CartItem, Category, Product, User
+
+
+class RoleClaimsJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.factory = APIRequestFactory()
+
+    def authenticate(self, method, token):
+        request = getattr(self.factory, method)(
+            "/", HTTP_AUTHORIZATION=f"JWT {token}"
+        )
+        return RoleClaimsJWTAuthentication().authenticate(request)
+
+    def test_token_carries_roles(self):
+        self.user.set_password("12345")
+        self.user.save()
+        response = self.client.post(
+            reverse("jwt-create"),
+            {"username": "mint", "password": "12345"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        token = AccessToken(response.data["access"])
+        self.assertEqual(int(token["user_id"]), self.user.id)
+        self.assertTrue(token["is_supplier"])
+        self.assertFalse(token["is_staff"])
+
+        refreshed = RefreshToken(response.data["refresh"]).access_token
+        self.assertTrue(refreshed["is_supplier"])
+
+    def test_read_trusts_claims(self):
+        token = RefreshToken.for_user(self.user)
+        token["is_supplier"], token["is_staff"] = True, False
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate("get", token.access_token)
+        self.assertIsInstance(user, RoleClaimsUser)
+        self.assertEqual(user.id, self.user.id)
+        self.assertTrue(user.is_supplier)
+        self.assertFalse(user.is_staff)
+
+    def test_write_loads_user(self):
+        token = RefreshToken.for_user(self.user)
+        token["is_supplier"], token["is_staff"] = True, False
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate("post", token.access_token)
+        self.assertEqual(user, self.user)
+
+    def test_token_without_roles_loads_user(self):
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate("get", token)
+        self.assertEqual(user, self.user)
+
+
+@override_settings(JWT_ROLE_CLAIMS=True)
+class RoleClaimsSettingTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="mint", email="mint@example.com", password="12345"
+        )
+        token = RefreshToken.for_user(self.user)
+        token["is_supplier"], token["is_staff"] = False, False
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"JWT {token.access_token}"
+        )
+
+    def test_shop_reads_trust_claims(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("orders"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            [query for query in queries if "myshop_user" in query["sql"]]
+        )
+
+    def test_djoser_loads_user(self):
+        response = self.client.get(reverse("user-me"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], self.user.id)
+        self.assertEqual(response.data["username"], "mint")
+        self.assertEqual(response.data["email"], "mint@example.com")
+
+
+class RoleClaimsUserViewsTest(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(title="phones", description="1")
+        supplier = User.objects.create(
+            username="supplier", password="12345", is_supplier=True
+        )
+        self.client_user = User.objects.create(
+            username="client", password="12345"
+        )
+        product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=category,
+            user=supplier,
+        )
+        self.cart_item = CartItem.objects.create(
+            user=self.client_user, product=product, quantity=1
+        )
+        token = AccessToken.for_user(self.client_user)
+        token["is_supplier"], token["is_staff"] = False, False
+        self.client.force_authenticate(RoleClaimsUser(token))
+
+    def test_cart(self):
+        response = self.client.get(reverse("cart"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["products"]), 1)
+
+    def test_cart_item(self):
+        response = self.client.get(
+            reverse("cart-detail", args=(self.cart_item.id,))
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_orders(self):
+        response = self.client.get(reverse("orders"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -0,0 +1,63 @@
+from django.test import SimpleTestCase
+from myshop.autocomplete import PrefixIndex
+
+
+class PrefixIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = PrefixIndex(limit=3)
+        self.index.build(
+            [
+                (1, "Iphone 13 Pro", (4.5, 10)),
+                (2, "Iphone 12", (4.8, 3)),
+                (3, "Ipad Pro", (3.0, 1)),
+                (4, "Galaxy S21", (5.0, 1)),
+            ]
+        )
+
+    def ids(self, prefix, limit=3):
+        return [entry_id for entry_id, _ in self.index.search(prefix, limit)]
+
+    def test_best_first(self):
+        self.assertEqual(self.ids("ip"), [2, 1, 3])
+        self.assertEqual(self.ids("ip", limit=1), [2])
+
+    def test_word_prefix(self):
+        self.assertEqual(self.ids("pro"), [1, 3])
+        self.assertEqual(self.ids("13 P"), [1])
+
+    def test_no_match(self):
+        self.assertEqual(self.ids("nokia"), [])
+
+    def test_long_prefix(self):
+        self.assertEqual(self.ids("iphone 13 pro"), [1])
+        self.assertEqual(self.ids("iphone 14"), [])
+
+    def test_cached_top(self):
+        self.index.scan_limit = 1
+        self.assertEqual(self.ids("ip"), [2, 1, 3])
+        self.assertIn("ip", self.index.top)
+        self.index.add(5, "Ipod", (4.9, 1))
+        self.assertEqual(self.ids("ip"), [5, 2, 1])
+        self.index.remove(2)
+        self.assertNotIn("ip", self.index.top)
+        self.assertEqual(self.ids("ip"), [5, 1, 3])
+
+    def test_add(self):
+        self.index.add(5, "Iphone 14", (4.9, 1))
+        self.assertEqual(self.ids("iph"), [5, 2, 1])
+
+    def test_update(self):
+        self.index.add(2, "Nokia 3310", (1.0, 1))
+        self.assertEqual(self.ids("iph"), [1])
+        self.assertEqual(self.ids("nok"), [2])
+
+    def test_retitle_keeps_score(self):
+        self.index.retitle(4, "Ipod", (0.0, 0))
+        self.assertEqual(self.ids("ip"), [4, 2, 1])
+        self.index.retitle(5, "Ipad Air", (0.0, 0))
+        self.assertEqual(self.ids("ipad"), [3, 5])
+
+    def test_remove(self):
+        self.index.remove(4)
+        self.assertEqual(self.ids("g"), [])
+        self.index.remove(4)
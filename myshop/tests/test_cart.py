@@ -0,0 +1,322 @@
+import time
+from decimal import Decimal
+from threading import Thread
+from unittest import mock
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from myshop import cart
+from myshop.cart import apply_cart_operations, get_cart, invalidate_cart
+from myshop.querysets import cart_total
+from myshop.models import CartItem, Category, Product, User
+
+
+class CartCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title="123", description="123")
+        supplier = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.user = User.objects.create(username="mint2", password="12345")
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=100,
+            discount=10,
+            category=category,
+            user=supplier,
+        )
+        self.cart_item = CartItem.objects.create(
+            product=self.product, user=self.user, quantity=2
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_cart_read_once_from_database(self):
+        # Items, then their total
+        with self.assertNumQueries(2):
+            cart = get_cart(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart, get_cart(self.user.id))
+        self.assertEqual(cart["total_price"], 180)
+        self.assertEqual(cart["products"][0]["price"], "90.00")
+
+    def test_cart_view_served_from_cache(self):
+        self.client.get(reverse("cart"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("cart"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["products"]), 1)
+
+    def test_writes_refresh_cart(self):
+        url = reverse("cart-detail", args=(self.cart_item.id,))
+        get_cart(self.user.id)
+        self.client.patch(url, {"quantity": 3}, format="json")
+        self.assertEqual(get_cart(self.user.id)["total_price"], 270)
+
+        self.client.post(
+            reverse("cart"),
+            {"product": self.product.id, "quantity": 1},
+            format="json",
+        )
+        self.assertEqual(get_cart(self.user.id)["total_price"], 360)
+
+        self.client.delete(url)
+        self.assertEqual(get_cart(self.user.id)["products"], [])
+
+    def test_checkout_empties_cart(self):
+        get_cart(self.user.id)
+        response = self.client.post(
+            reverse("checkout-cart"),
+            {"ids": [self.cart_item.id]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_cart(self.user.id)["products"], [])
+
+    def test_write_during_read_is_not_cached(self):
+        def build_then_write(user_id):
+            built = build_cart(user_id)
+            # A write committing after the read, without its signal
+            CartItem.objects.filter(pk=self.cart_item.pk).update(quantity=3)
+            invalidate_cart(user_id)
+            return built
+
+        build_cart = cart.build_cart
+        with mock.patch.object(
+            cart, "build_cart", side_effect=build_then_write
+        ):
+            self.assertEqual(get_cart(self.user.id)["total_price"], 180)
+        self.assertEqual(get_cart(self.user.id)["products"][0]["quantity"], 3)
+
+    def test_deleted_product_leaves_cart(self):
+        get_cart(self.user.id)
+        self.product.delete()
+        self.assertEqual(get_cart(self.user.id)["products"], [])
+
+
+class CartTotalTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            title="123", description="123"
+        )
+        self.user = User.objects.create(username="mint2", password="12345")
+
+    def test_total_is_exact(self):
+        for quantity in (1, 2, 7):
+            product = Product.objects.create(
+                title="Iphone",
+                description="Iphone_x",
+                price=Decimal("0.10"),
+                category=self.category,
+                user=self.user,
+            )
+            CartItem.objects.create(
+                product=product, user=self.user, quantity=quantity
+            )
+        with self.assertNumQueries(1):
+            total = cart_total(CartItem.objects.all())
+        self.assertEqual(Decimal("1.00"), total)
+        self.assertEqual("1.00", str(total))
+
+    def test_no_items(self):
+        self.assertEqual(Decimal("0.00"), cart_total(CartItem.objects.all()))
+
+
+class CartBulkViewTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title="123", description="123")
+        self.supplier = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.user = User.objects.create(username="mint2", password="12345")
+        self.products = [
+            Product.objects.create(
+                title=f"Iphone {i}",
+                description="Iphone_x",
+                price=100,
+                category=category,
+                user=self.supplier,
+            )
+            for i in range(12)
+        ]
+        self.url = reverse("cart-bulk")
+        self.client.force_authenticate(self.user)
+
+    def quantities(self):
+        return dict(
+            CartItem.objects.filter(user=self.user).values_list(
+                "product_id", "quantity"
+            )
+        )
+
+    def test_operations(self):
+        first, second, third = self.products[:3]
+        CartItem.objects.create(product=first, user=self.user, quantity=2)
+        CartItem.objects.create(product=second, user=self.user, quantity=2)
+        operations = [
+            {"product": first.id, "op": "add", "quantity": 3},
+            {"product": second.id, "op": "remove"},
+            {"product": third.id, "op": "set", "quantity": 4},
+            {"product": third.id},
+        ]
+        response = self.client.post(self.url, operations, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({first.id: 5, third.id: 5}, self.quantities())
+        self.assertEqual(response.data["total_price"], 1000)
+
+    def test_set_zero_removes_item(self):
+        product = self.products[0]
+        CartItem.objects.create(product=product, user=self.user, quantity=2)
+        self.client.post(
+            self.url,
+            [{"product": product.id, "op": "set", "quantity": 0}],
+            format="json",
+        )
+        self.assertEqual({}, self.quantities())
+
+    def test_query_count_is_flat(self):
+        with self.assertNumQueries(8):
+            self.client.post(
+                self.url,
+                [{"product": product.id} for product in self.products[:2]],
+                format="json",
+            )
+        with self.assertNumQueries(8):
+            self.client.post(
+                self.url,
+                [{"product": product.id} for product in self.products],
+                format="json",
+            )
+        self.assertEqual(
+            {product.id: 1 for product in self.products[2:]}
+            | {product.id: 2 for product in self.products[:2]},
+            self.quantities(),
+        )
+
+    def test_new_items_are_inserted_before_locking(self):
+        with CaptureQueriesContext(connection) as queries:
+            apply_cart_operations(
+                self.user.id,
+                [{"product": self.products[0].id, "op": "add", "quantity": 1}],
+            )
+        statements = [
+            query["sql"]
+            for query in queries
+            if '"myshop_cartitem"' in query["sql"]
+        ]
+        # The read of quantities locks every item, new ones included
+        self.assertTrue(statements[0].startswith("INSERT"), statements)
+        self.assertTrue(statements[1].startswith("SELECT"), statements)
+
+    def test_unknown_product_changes_nothing(self):
+        response = self.client.post(
+            self.url,
+            [{"product": self.products[0].id}, {"product": 0}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["products"], [0])
+        self.assertEqual({}, self.quantities())
+
+    def test_invalid_operations(self):
+        for operations in [
+            [],
+            [{"product": self.products[0].id, "op": "double"}],
+            [{"product": self.products[0].id, "quantity": -1}],
+        ]:
+            with self.subTest(operations=operations):
+                response = self.client.post(
+                    self.url, operations, format="json"
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+
+    def test_too_many_operations(self):
+        with self.settings(CART_MAX_OPERATIONS=1):
+            response = self.client.post(
+                self.url,
+                [{"product": product.id} for product in self.products[:2]],
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_supplier(self):
+        self.client.force_authenticate(self.supplier)
+        response = self.client.post(
+            self.url, [{"product": self.products[0].id}], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_post_adds_to_existing_item(self):
+        product = self.products[0]
+        for _ in range(2):
+            response = self.client.post(
+                reverse("cart"),
+                {"product": product.id, "quantity": 2},
+                format="json",
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["quantity"], 4)
+        self.assertEqual({product.id: 4}, self.quantities())
+
+
+class CartConcurrentAddTest(TransactionTestCase):
+    def setUp(self):
+        category = Category.objects.create(title="123", description="123")
+        self.user = User.objects.create(username="mint2", password="12345")
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=100,
+            category=category,
+            user=self.user,
+        )
+
+    def add_in_other_connection(self):
+        # Retried while the first add holds the database
+        try:
+            for _ in range(100):
+                try:
+                    apply_cart_operations(
+                        self.user.id,
+                        [
+                            {
+                                "product": self.product.id,
+                                "op": "add",
+                                "quantity": 2,
+                            }
+                        ],
+                    )
+                    return
+                except OperationalError:
+                    time.sleep(0.05)
+        finally:
+            connection.close()
+
+    def test_adds_of_new_product_are_summed(self):
+        other = Thread(target=self.add_in_other_connection)
+        invalidate = cart.invalidate_cart
+
+        def add_other_then_invalidate(*user_ids):
+            # The first add has written its items, not committed them
+            if not other.is_alive() and other.ident is None:
+                other.start()
+                other.join(0.5)
+            return invalidate(*user_ids)
+
+        with mock.patch.object(
+            cart, "invalidate_cart", side_effect=add_other_then_invalidate
+        ):
+            apply_cart_operations(
+                self.user.id,
+                [{"product": self.product.id, "op": "add", "quantity": 1}],
+            )
+            other.join()
+        self.assertEqual(3, CartItem.objects.get(user=self.user).quantity)
@@ -0,0 +1,176 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from threading import Thread
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from myshop import models
+from myshop.management.commands import recompute_ratings
+from myshop.models import Product, Category, Comment, IdempotencyKey, User
+
+
+class RecomputeRatingsCommandTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            title="phones1", description="Phones"
+        )
+        self.user = User.objects.create(username="user", password="123456")
+        self.product1 = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+        self.product2 = Product.objects.create(
+            title="Pixel",
+            description="Pixel",
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+        for rate in (5, 4, 4):
+            Comment.objects.create(
+                product=self.product1, rate=rate, content="1", user=self.user
+            )
+        Comment.objects.create(
+            product=self.product2, rate=1, content="1", user=self.user
+        )
+        Product.objects.update(rating=0, quantity_rates=0, rates_sum=0)
+
+    def test_recompute_ratings(self):
+        out = StringIO()
+        call_command("recompute_ratings", "--batch-size=1", stdout=out)
+        product1 = Product.objects.get(id=self.product1.id)
+        product2 = Product.objects.get(id=self.product2.id)
+        self.assertEquals(Decimal("4.33"), product1.rating)
+        self.assertEquals(3, product1.quantity_rates)
+        self.assertEquals(13, product1.rates_sum)
+        self.assertEquals(1, product2.rating)
+        self.assertIn("Recomputed 2 products from 4 rates", out.getvalue())
+        self.assertIn("2 updated", out.getvalue())
+
+    def test_recompute_ratings_keeps_rates_added_while_running(self):
+        invalidate_products = recompute_ratings.invalidate_products
+
+        def rate_product2(*product_ids):
+            # Runs after the first batch, before product2 is read
+            invalidate_products(*product_ids)
+            if self.product1.id in product_ids:
+                Comment.objects.create(
+                    product=self.product2,
+                    rate=5,
+                    content="1",
+                    user=self.user,
+                )
+
+        with mock.patch.object(
+            recompute_ratings, "invalidate_products", rate_product2
+        ):
+            call_command(
+                "recompute_ratings", "--batch-size=1", stdout=StringIO()
+            )
+        product2 = Product.objects.get(id=self.product2.id)
+        self.assertEquals(2, product2.quantity_rates)
+        self.assertEquals(6, product2.rates_sum)
+        self.assertEquals(3, product2.rating)
+
+    def test_recompute_ratings_resets_products_without_rates(self):
+        Product.objects.filter(id=self.product2.id).update(
+            rating=3, quantity_rates=1, rates_sum=3
+        )
+        Comment.objects.filter(product=self.product2).update(rate=None)
+        call_command("recompute_ratings", stdout=StringIO())
+        product2 = Product.objects.get(id=self.product2.id)
+        self.assertEquals(0, product2.rating)
+        self.assertEquals(0, product2.quantity_rates)
+
+    def test_recompute_ratings_since(self):
+        Comment.objects.filter(product=self.product1).update(
+            creation_date=timezone.now() - timedelta(days=10)
+        )
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        out = StringIO()
+        call_command("recompute_ratings", f"--since={since}", stdout=out)
+        self.assertEquals(0, Product.objects.get(id=self.product1.id).rating)
+        self.assertEquals(1, Product.objects.get(id=self.product2.id).rating)
+        self.assertIn("Recomputed 1 products", out.getvalue())
+
+    def test_recompute_ratings_invalid_since(self):
+        with self.assertRaises(CommandError):
+            call_command("recompute_ratings", "--since=yesterday")
+
+
+class RecomputeRatingsConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        category = Category.objects.create(title="phones", description="1")
+        self.user = User.objects.create(username="user", password="123456")
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=category,
+            user=self.user,
+        )
+
+    def recompute_in_other_connection(self):
+        # Retried while the comment transaction holds the database
+        try:
+            for _ in range(100):
+                try:
+                    call_command("recompute_ratings", stdout=StringIO())
+                    return
+                except OperationalError:
+                    time.sleep(0.05)
+        finally:
+            connection.close()
+
+    def test_batch_between_insert_and_delta(self):
+        change_product_rating = models.change_product_rating
+        batch = Thread(target=self.recompute_in_other_connection)
+
+        def recompute_then_change(*args):
+            batch.start()
+            batch.join(0.5)
+            return change_product_rating(*args)
+
+        with mock.patch.object(
+            models, "change_product_rating", side_effect=recompute_then_change
+        ):
+            Comment.objects.create(
+                product=self.product, content="1", rate=4, user=self.user
+            )
+        batch.join()
+        self.product.refresh_from_db()
+        self.assertEqual(1, self.product.quantity_rates)
+        self.assertEqual(4, self.product.rates_sum)
+        self.assertEqual(Decimal(4), self.product.rating)
+
+
+class DeleteExpiredIdempotencyKeysCommandTest(TestCase):
+    def test_delete_expired_keys(self):
+        user = User.objects.create(username="user", password="123456")
+        for key in ("1", "2", "3"):
+            IdempotencyKey.objects.create(
+                user=user,
+                key=key,
+                request_hash="",
+                response_status=200,
+                response_data={},
+            )
+        IdempotencyKey.objects.exclude(key="3").update(
+            creation_date=timezone.now() - timedelta(days=2)
+        )
+        out = StringIO()
+        call_command(
+            "delete_expired_idempotency_keys", "--batch-size=1", stdout=out
+        )
+        self.assertEqual(
+            ["3"], list(IdempotencyKey.objects.values_list("key", flat=True))
+        )
+        self.assertIn("Deleted 2 expired", out.getvalue())
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+from django.test import SimpleTestCase, override_settings
+
+
+class ServeMediaTest(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        os.makedirs(os.path.join(self.media_root, "images", "products"))
+        with open(
+            os.path.join(self.media_root, "images", "products", "a.jpg"), "wb"
+        ) as file:
+            file.write(b"picture")
+        with open(os.path.join(self.media_root, "secret.txt"), "wb") as file:
+            file.write(b"secret")
+
+    @override_settings(MEDIA_SERVING="nginx")
+    def test_nginx_redirects_to_internal_location(self):
+        response = self.client.get("/media/images/products/a.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            "/protected-media/images/products/a.jpg",
+        )
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response.content, b"")
+
+    @override_settings(MEDIA_SERVING="nginx")
+    def test_nginx_rejects_files_outside_public_dirs(self):
+        for path in [
+            "/media/secret.txt",
+            "/media/manage.py",
+            "/media/images/../shop/settings.py",
+            "/media/images/%2e%2e/shop/settings.py",
+        ]:
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn("X-Accel-Redirect", response)
+
+    @override_settings(MEDIA_SERVING="django", DEBUG=True)
+    def test_django_serves_file_in_debug(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get("/media/images/products/a.jpg")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b"".join(response.streaming_content), b"picture")
+            self.assertEqual(
+                self.client.get("/media/secret.txt").status_code, 404
+            )
+
+    @override_settings(MEDIA_SERVING="django", DEBUG=False)
+    def test_django_serves_nothing_without_debug(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get("/media/images/products/a.jpg")
+            self.assertEqual(response.status_code, 404)
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from django.test import TestCase
 from myshop.models import (
     Product,
@@ -75,6 +76,43 @@ class ProductCommentTest(TestCase):
         self.assertEquals(self.product.quantity_rates, 3)
 
 
+class CommentThreadTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            title="phones1", description="Phones"
+        )
+        self.user = User.objects.create(username="user", password="123456")
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+
+    def test_comment_thread_root_and_depth(self):
+        root = Comment.objects.create(
+            product=self.product, content="1", rate=4, user=self.user
+        )
+        reply = Comment.objects.create(
+            product=self.product,
+            content="2",
+            user=self.user,
+            comment_of_reply=root,
+        )
+        reply_of_reply = Comment.objects.create(
+            product=self.product,
+            content="3",
+            user=self.user,
+            comment_of_reply=reply,
+        )
+        self.assertEquals((root.thread_root, root.depth), (None, 0))
+        self.assertEquals((reply.thread_root, reply.depth), (root, 1))
+        self.assertEquals(
+            (reply_of_reply.thread_root, reply_of_reply.depth), (root, 2)
+        )
+
+
 class ProductModelTest(TestCase):
     def setUp(self):
         self.category = Category.objects.create(
@@ -144,6 +182,76 @@ class ProductModelTest(TestCase):
         self.assertEquals(expected_product_rating, self.product.rating)
 
 
+class ProductRatingTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            title="phones1", description="Phones"
+        )
+        self.user = User.objects.create(username="user", password="123456")
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+
+    def test_product_rating_after_comment_delete(self):
+        Comment.objects.create(
+            product=self.product, rate=5, content="5", user=self.user
+        )
+        comment = Comment.objects.create(
+            product=self.product, rate=2, content="2", user=self.user
+        )
+        Comment.objects.get(id=comment.id).delete()
+        product = Product.objects.get(id=self.product.id)
+        self.assertEquals(5, product.rating)
+        self.assertEquals(1, product.quantity_rates)
+        self.assertEquals(5, product.rates_sum)
+
+    def test_product_rating_after_last_comment_delete(self):
+        comment = Comment.objects.create(
+            product=self.product, rate=4, content="4", user=self.user
+        )
+        Comment.objects.get(id=comment.id).delete()
+        product = Product.objects.get(id=self.product.id)
+        self.assertEquals(0, product.rating)
+        self.assertEquals(0, product.quantity_rates)
+
+    def test_product_rating_with_stale_product_instances(self):
+        first = Comment(rate=5, content="5", user=self.user)
+        first.product = Product.objects.get(id=self.product.id)
+        second = Comment(rate=2, content="2", user=self.user)
+        second.product = Product.objects.get(id=self.product.id)
+        first.save()
+        second.save()
+        product = Product.objects.get(id=self.product.id)
+        self.assertEquals(Decimal("3.50"), product.rating)
+        self.assertEquals(2, product.quantity_rates)
+
+    def test_rating_update_keeps_other_product_columns(self):
+        product = Product.objects.get(id=self.product.id)
+        Product.objects.filter(id=self.product.id).update(title="Pixel")
+        Comment.objects.create(
+            product=product, rate=3, content="3", user=self.user
+        )
+        self.assertEquals("Pixel", Product.objects.get(id=product.id).title)
+
+    def test_reply_does_not_change_rating(self):
+        comment = Comment.objects.create(
+            product=self.product, rate=3, content="3", user=self.user
+        )
+        Comment.objects.create(
+            product=self.product,
+            content="reply",
+            user=self.user,
+            comment_of_reply=comment,
+        )
+        product = Product.objects.get(id=self.product.id)
+        self.assertEquals(3, product.rating)
+        self.assertEquals(1, product.quantity_rates)
+
+
 class CartItemModelTest(TestCase):
     def setUp(self):
         self.category = Category.objects.create(
@@ -188,6 +296,41 @@ class CartItemModelTest(TestCase):
         self.assertEquals(expected_cart_item_price, cart_item.price)
 
 
+class ProductEffectivePriceTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            title="phones1", description="Phones"
+        )
+        self.user = User.objects.create(username="user", password="123456")
+
+    def test_effective_price_is_exact(self):
+        product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=Decimal("19.99"),
+            discount=15,
+            category=self.category,
+            user=self.user,
+        )
+        product.refresh_from_db()
+        # 19.99 * 0.85 = 16.9915
+        self.assertEqual(product.effective_price, Decimal("16.99"))
+
+    def test_effective_price_follows_discount(self):
+        product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=1000,
+            category=self.category,
+            user=self.user,
+        )
+        self.assertEqual(product.effective_price, 1000)
+        product.discount = 30
+        product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, 700)
+
+
 class OrerItemModelTest(TestCase):
     def setUp(self):
         self.category = Category.objects.create(
@@ -0,0 +1,69 @@
+import datetime
+import io
+from decimal import Decimal
+from django.test import TestCase
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from myshop.renderers import ORJSONRenderer, ORJSONParser
+from myshop.management.commands.benchmark_renderers import (
+    product_list_payload,
+)
+
+
+class ORJSONRendererTest(TestCase):
+    def test_render_product_list_like_json_renderer(self):
+        data = product_list_payload(5, 2)
+        self.assertEquals(
+            JSONRenderer().render(data), ORJSONRenderer().render(data)
+        )
+
+    def test_render_decimal(self):
+        data = {"total_price": Decimal("12.50")}
+        self.assertEquals(
+            b'{"total_price":12.5}', ORJSONRenderer().render(data)
+        )
+
+    def test_render_datetime_with_datetime_format(self):
+        data = {"date": datetime.datetime(2021, 8, 4, 18, 52, 0, 123456)}
+        self.assertEquals(
+            b'{"date":"2021-08-04 18:52:00.123456"}',
+            ORJSONRenderer().render(data),
+        )
+
+    def test_render_line_separators_escaped(self):
+        data = {"content": "a\u2028b"}
+        self.assertEquals(
+            b'{"content":"a\\u2028b"}', ORJSONRenderer().render(data)
+        )
+
+    def test_render_indent(self):
+        data = {"ids": [1]}
+        indented = b'{\n  "ids": [\n    1\n  ]\n}'
+        renderer = ORJSONRenderer()
+        self.assertEquals(
+            indented, renderer.render(data, "application/json; indent=4")
+        )
+        self.assertEquals(
+            indented, renderer.render(data, None, {"indent": 4})
+        )
+        for media_type in ("indent=0", "xindent=4"):
+            self.assertEquals(
+                b'{"ids":[1]}',
+                renderer.render(data, f"application/json; {media_type}"),
+            )
+
+    def test_render_none(self):
+        self.assertEquals(b"", ORJSONRenderer().render(None))
+
+
+class ORJSONParserTest(TestCase):
+    def test_parse(self):
+        stream = io.BytesIO(b'{"ids": [1, 2], "promocode": "twenty"}')
+        self.assertEquals(
+            {"ids": [1, 2], "promocode": "twenty"},
+            ORJSONParser().parse(stream),
+        )
+
+    def test_parse_error(self):
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"ids": '))
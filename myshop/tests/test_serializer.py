@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from myshop.models import (
     Product,
     Category,
@@ -8,10 +8,17 @@ from myshop.models import (
     User,
 )
 from myshop.serializers import (
-    CommentSerializer,
+    CommentThreadSerializer,
     CategorySerializer,
     CartSerializer,
     PictureSerializer,
+    ProductSerializer,
+    OrderSerializer,
+)
+from myshop.querysets import attach_comment_replies, related_lookups
+from myshop.management.commands.benchmark_picture_urls import (
+    StoragePictureSerializer,
+    unsaved_pictures,
 )
 from decouple import config
 from collections import OrderedDict
@@ -61,7 +68,9 @@ class CommentSerializerTest(TestCase):
         )
 
     def test_comment_serializer_data(self):
-        serializer = CommentSerializer(Comment.objects.all().first())
+        root = Comment.objects.all().first()
+        attach_comment_replies([root], max_depth=10)
+        serializer = CommentThreadSerializer(root)
         expected_data = {
             "id": self.comment1.id,
             "rate": self.comment1.rate,
@@ -130,5 +139,52 @@ class PictureSerializerTest(TestCase):
             "id": self.picture.id,
             "picture": config("DOMEN") + "/media/" + str(self.picture.picture),
             "product": self.product.id,
+            "variants": {},
         }
         self.assertEquals(expected_data, serializer.data)
+
+    def test_variant_urls(self):
+        self.picture.variants = {"thumbnail": "123_thumbnail.webp"}
+        serializer = PictureSerializer(self.picture)
+        self.assertEquals(
+            {"thumbnail": config("DOMEN") + "/media/123_thumbnail.webp"},
+            serializer.data["variants"],
+        )
+
+    @override_settings(MEDIA_BASE_URL="https://cdn.example.com/shop/")
+    def test_media_base_url(self):
+        self.picture.picture = "images/products/a b.jpg"
+        self.picture.variants = {"thumbnail": "images/products/a.webp"}
+        serializer = PictureSerializer(self.picture)
+        self.assertEquals(
+            "https://cdn.example.com/shop/images/products/a%20b.jpg",
+            serializer.data["picture"],
+        )
+        self.assertEquals(
+            {
+                "thumbnail": (
+                    "https://cdn.example.com/shop/images/products/a.webp"
+                )
+            },
+            serializer.data["variants"],
+        )
+
+    def test_urls_match_storage_urls(self):
+        pictures = unsaved_pictures(3)
+        pictures[0].picture = "images/products/ü ?.jpg"
+        self.assertEquals(
+            StoragePictureSerializer(pictures, many=True).data,
+            PictureSerializer(pictures, many=True).data,
+        )
+
+
+class RelatedLookupsTest(TestCase):
+    def test_product_serializer_lookups(self):
+        self.assertEquals(
+            ((), ("pictures",)), related_lookups(ProductSerializer)
+        )
+
+    def test_order_serializer_lookups(self):
+        self.assertEquals(
+            ((), ("order_items",)), related_lookups(OrderSerializer)
+        )
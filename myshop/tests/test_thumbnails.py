@@ -0,0 +1,344 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from myshop import thumbnails
+from myshop.imaging import render_variants
+from myshop.models import Category, Product, ProductPicture, User
+from myshop.storage import HashingFileUploadHandler, picture_storage
+from myshop.thumbnails import delete_unreferenced_files
+
+
+def image_data(size=(1200, 600), mode="RGB", format="JPEG"):
+    output = io.BytesIO()
+    Image.new(mode, size).save(output, format)
+    return output.getvalue()
+
+
+class RenderVariantsTest(TestCase):
+    def test_variants_fit_size(self):
+        variants = render_variants(
+            image_data(), {"thumbnail": 200, "medium": 800}, 80
+        )
+        with Image.open(io.BytesIO(variants["thumbnail"])) as image:
+            self.assertEquals("WEBP", image.format)
+            self.assertEquals((200, 100), image.size)
+        with Image.open(io.BytesIO(variants["medium"])) as image:
+            self.assertEquals((800, 400), image.size)
+
+    def test_variants_are_not_upscaled(self):
+        variants = render_variants(image_data((100, 50)), {"medium": 800}, 80)
+        with Image.open(io.BytesIO(variants["medium"])) as image:
+            self.assertEquals((100, 50), image.size)
+
+    def test_transparency_is_kept(self):
+        data = image_data(mode="LA", format="PNG")
+        variants = render_variants(data, {"thumbnail": 200}, 80)
+        with Image.open(io.BytesIO(variants["thumbnail"])) as image:
+            self.assertEquals("RGBA", image.mode)
+
+
+class PictureVariantsTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            MEDIA_ROOT=media_root, PICTURE_VARIANTS_SYNC=True
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        category = Category.objects.create(title="phones", description="1")
+        user = User.objects.create(username="user", password="123456")
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=category,
+            user=user,
+        )
+
+    def create_picture(self):
+        picture = ProductPicture(product=self.product)
+        picture.picture.save("1.jpg", ContentFile(image_data()), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            picture.save()
+        picture.refresh_from_db()
+        return picture
+
+    def test_variants_generated_after_upload(self):
+        picture = self.create_picture()
+        self.assertEquals({"thumbnail", "medium"}, set(picture.variants))
+        for name in picture.variants.values():
+            self.assertTrue(name.endswith(".webp"))
+            self.assertTrue(picture_storage.exists(name))
+
+    def test_regenerated_variants_replace_files(self):
+        picture = self.create_picture()
+        variants = thumbnails.generate_variants(
+            picture, lambda *args: {"thumbnail": b"new"}
+        )
+        self.assertEquals(picture.variants["thumbnail"], variants["thumbnail"])
+        with picture_storage.open(variants["thumbnail"]) as file:
+            self.assertEquals(b"new", file.read())
+
+    def test_variants_deleted_with_picture(self):
+        picture = self.create_picture()
+        picture.delete()
+        delete_unreferenced_files(0)
+        for name in picture.variants.values():
+            self.assertFalse(picture_storage.exists(name))
+
+    def test_missing_file_does_not_fail_upload(self):
+        with self.assertLogs("myshop.thumbnails", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                picture = ProductPicture.objects.create(
+                    product=self.product, picture="missing.jpg"
+                )
+        picture.refresh_from_db()
+        self.assertEquals({}, picture.variants)
+
+    def test_generate_picture_variants_command(self):
+        picture = self.create_picture()
+        ProductPicture.objects.update(variants={})
+        out = io.StringIO()
+        call_command("generate_picture_variants", stdout=out)
+        picture.refresh_from_db()
+        self.assertEquals({"thumbnail", "medium"}, set(picture.variants))
+        self.assertIn(
+            "Generated variants of 1 pictures, 0 failed", out.getvalue()
+        )
+
+
+class PictureDeduplicationTest(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            MEDIA_ROOT=media_root, PICTURE_VARIANTS_SYNC=True
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        category = Category.objects.create(title="phones", description="1")
+        self.user = User.objects.create(
+            username="user", password="123456", is_supplier=True
+        )
+        self.products = [
+            Product.objects.create(
+                title="Iphone",
+                description="Iphone_x",
+                price=12345,
+                category=category,
+                user=self.user,
+            )
+            for _ in range(2)
+        ]
+        self.data = image_data()
+
+    def upload(self, product, name="1.JPG"):
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("products-pictures", args=(product.id,)),
+                {"picture": SimpleUploadedFile(name, self.data)},
+            )
+        self.assertEquals(201, response.status_code)
+        return ProductPicture.objects.filter(product=product).latest("id")
+
+    def delete(self, picture):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse(
+                    "products-pictures-detail",
+                    args=(picture.product_id, picture.id),
+                )
+            )
+
+    def test_same_content_stored_once(self):
+        first = self.upload(self.products[0])
+        second = self.upload(self.products[1], "other.jpg")
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEquals(
+            f"images/products/{digest[:2]}/{digest[2:4]}/{digest}.jpg",
+            first.picture.name,
+        )
+        self.assertEquals(first.picture.name, second.picture.name)
+        self.assertEquals(first.variants, second.variants)
+        directory = os.path.dirname(first.picture.path)
+        self.assertEquals(
+            [
+                f"{digest}.jpg",
+                f"{digest}_medium.webp",
+                f"{digest}_thumbnail.webp",
+            ],
+            sorted(os.listdir(directory)),
+        )
+
+    def test_file_deleted_with_last_reference(self):
+        first = self.upload(self.products[0])
+        second = self.upload(self.products[1])
+        files = [first.picture.name, *first.variants.values()]
+
+        self.delete(first)
+        self.assertEquals(0, delete_unreferenced_files(0))
+        for name in files:
+            self.assertTrue(picture_storage.exists(name))
+        self.delete(second)
+        self.assertEquals(3, delete_unreferenced_files(0))
+        for name in files:
+            self.assertFalse(picture_storage.exists(name))
+
+    def test_recently_saved_file_is_kept(self):
+        picture = self.upload(self.products[0])
+        self.delete(picture)
+        out = io.StringIO()
+        call_command("delete_unreferenced_pictures", stdout=out)
+        self.assertIn("Deleted 0 unreferenced picture files", out.getvalue())
+        self.assertTrue(picture_storage.exists(picture.picture.name))
+
+    def test_reupload_during_collection_is_kept(self):
+        picture = self.upload(self.products[0])
+        self.delete(picture)
+        files = [picture.picture.name, *picture.variants.values()]
+        for name in files:
+            os.utime(picture_storage.path(name), (0, 0))
+
+        referenced = thumbnails._referenced_files
+        calls = []
+
+        def upload_then_read():
+            calls.append(None)
+            if len(calls) == 2:
+                # Uploaded once the unreferenced files were moved aside
+                self.upload(self.products[1])
+            return referenced()
+
+        with mock.patch.object(
+            thumbnails, "_referenced_files", side_effect=upload_then_read
+        ):
+            self.assertEquals(0, delete_unreferenced_files(60))
+        for name in files:
+            self.assertTrue(picture_storage.exists(name))
+
+    def test_reused_file_is_refreshed(self):
+        picture = self.upload(self.products[0])
+        path = picture.picture.path
+        os.utime(path, (0, 0))
+        self.upload(self.products[1])
+        self.assertGreater(os.stat(path).st_mtime, 0)
+
+    def test_upload_is_hashed_while_streamed(self):
+        handler = HashingFileUploadHandler()
+        handler.new_file("picture", "1.jpg", "image/jpeg", len(self.data))
+        handler.receive_data_chunk(self.data[:100], 0)
+        handler.receive_data_chunk(self.data[100:], 100)
+        file = handler.file_complete(len(self.data))
+        self.assertEquals(hashlib.sha256(self.data).hexdigest(), file.sha256)
+
+
+class BulkPictureUploadTest(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            MEDIA_ROOT=media_root, PICTURE_VARIANTS_SYNC=True
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        category = Category.objects.create(title="phones", description="1")
+        self.user = User.objects.create(
+            username="user", password="123456", is_supplier=True
+        )
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=category,
+            user=self.user,
+        )
+        self.url = reverse("products-pictures-bulk", args=(self.product.id,))
+
+    def upload(self, files, user=None):
+        self.client.force_authenticate(user or self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {"pictures": files})
+
+    def test_upload_many_files(self):
+        files = [
+            SimpleUploadedFile("1.jpg", image_data((300, 200))),
+            SimpleUploadedFile("2.png", image_data((50, 50), format="PNG")),
+        ]
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            # One insert for all pictures, variants are made on commit
+            with self.assertNumQueries(5):
+                response = self.client.post(self.url, {"pictures": files})
+        for callback in callbacks:
+            callback()
+        self.assertEquals(201, response.status_code)
+        self.assertEquals(2, len(response.data))
+        pictures = ProductPicture.objects.filter(product=self.product)
+        self.assertEquals(
+            [picture["id"] for picture in response.data],
+            list(pictures.order_by("id").values_list("id", flat=True)),
+        )
+        for picture in pictures:
+            self.assertTrue(picture_storage.exists(picture.picture.name))
+            self.assertEquals(
+                set(picture.variants), {"thumbnail", "medium"}
+            )
+
+    def test_extension_follows_verified_format(self):
+        files = [
+            SimpleUploadedFile("x.html", image_data(format="PNG")),
+            SimpleUploadedFile("y", image_data()),
+        ]
+        response = self.upload(files)
+        self.assertEquals(201, response.status_code)
+        names = ProductPicture.objects.order_by("id").values_list(
+            "picture", flat=True
+        )
+        self.assertEquals(
+            [".png", ".jpg"], [os.path.splitext(name)[1] for name in names]
+        )
+
+    def test_invalid_file_rejects_whole_upload(self):
+        files = [
+            SimpleUploadedFile("1.jpg", image_data()),
+            SimpleUploadedFile("2.jpg", b"not an image"),
+        ]
+        response = self.upload(files)
+        self.assertEquals(400, response.status_code)
+        self.assertEquals(["1"], list(map(str, response.data["pictures"])))
+        self.assertFalse(ProductPicture.objects.exists())
+
+    def test_too_many_files(self):
+        with self.settings(PICTURE_UPLOAD_MAX_FILES=1):
+            response = self.upload(
+                [SimpleUploadedFile(f"{i}.jpg", image_data()) for i in "12"]
+            )
+        self.assertEquals(400, response.status_code)
+        self.assertFalse(ProductPicture.objects.exists())
+
+    def test_no_files(self):
+        self.assertEquals(400, self.upload([]).status_code)
+
+    def test_only_owner_can_upload(self):
+        other = User.objects.create(
+            username="other", password="123456", is_supplier=True
+        )
+        response = self.upload(
+            [SimpleUploadedFile("1.jpg", image_data())], other
+        )
+        self.assertEquals(403, response.status_code)
@@ -1,6 +1,14 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+from myshop import autocomplete, views
 from myshop.models import (
     Product,
     Category,
@@ -11,6 +19,7 @@ from myshop.models import (
     Order,
     User,
     Promocode,
+    IdempotencyKey,
 )
 
 
@@ -111,6 +120,674 @@ class ProductListViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class ProductListPaginationTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title="123", description="123")
+        self.user = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.products = [
+            Product.objects.create(
+                title=f"Iphone {i}",
+                description="Iphone_x",
+                price=12345,
+                category=self.category,
+                user=self.user,
+            )
+            for i in range(5)
+        ]
+
+    def test_first_page_is_newest_products(self):
+        url = reverse("products-list")
+        response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            [self.products[4].id, self.products[3].id],
+        )
+        self.assertIsNotNone(response.data["next"])
+        self.assertIsNone(response.data["previous"])
+
+    def test_cursor_walks_whole_catalog(self):
+        url = reverse("products-list")
+        response = self.client.get(url, {"page_size": 2})
+        ids = [product["id"] for product in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            ids += [product["id"] for product in response.data["results"]]
+        self.assertEqual(
+            ids, [product.id for product in reversed(self.products)]
+        )
+
+    def test_invalid_cursor(self):
+        url = reverse("products-list")
+        response = self.client.get(url, {"cursor": "123"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_walks_ties_past_offset_cutoff(self):
+        Product.objects.bulk_create(
+            Product(
+                title=f"Case {i}",
+                description="Case",
+                price=100,
+                effective_price=100,
+                category=self.category,
+                user=self.user,
+            )
+            for i in range(1250)
+        )
+        url = reverse("products-list")
+        response = self.client.get(
+            url, {"ordering": "price", "page_size": 100}
+        )
+        ids = [product["id"] for product in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            ids += [product["id"] for product in response.data["results"]]
+        self.assertEqual(
+            ids,
+            list(
+                Product.objects.order_by("effective_price", "id").values_list(
+                    "id", flat=True
+                )
+            ),
+        )
+
+    def test_previous_link(self):
+        url = reverse("products-list")
+        first = self.client.get(url, {"page_size": 2})
+        second = self.client.get(first.data["next"])
+        response = self.client.get(second.data["previous"])
+        self.assertEqual(response.data["results"], first.data["results"])
+        self.assertIsNone(response.data["previous"])
+        self.assertEqual(response.data["next"], first.data["next"])
+
+
+class ProductQueryCountTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title="123", description="123")
+        self.user = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+
+    def create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                title=f"Iphone {i}",
+                description="Iphone_x",
+                price=12345,
+                category=self.category,
+                user=self.user,
+            )
+            ProductPicture.objects.create(product=product, picture="1.jpg")
+            ProductPicture.objects.create(product=product, picture="2.jpg")
+
+    def test_product_list_query_count_is_flat(self):
+        url = reverse("products-list")
+        # Validators of the conditional response, products, pictures
+        self.create_products(1)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        self.create_products(10)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["results"]), 11)
+        self.assertEqual(len(response.data["results"][0]["pictures"]), 2)
+
+    def test_product_detail_query_count(self):
+        self.create_products(1)
+        product = Product.objects.get()
+        url = reverse("product-detail", args=(product.id,))
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+
+class ProductListFilterTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.phones = Category.objects.create(title="1", description="1")
+        self.laptops = Category.objects.create(title="2", description="2")
+        self.user = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.cheap = self.create_product(self.phones, 50, rating=3)
+        self.middle = self.create_product(
+            self.phones, 700, rating=5, discount=10
+        )
+        self.expensive = self.create_product(self.laptops, 20000, rating=4)
+        self.url = reverse("products-list")
+
+    def create_product(self, category, price, rating=0, discount=0):
+        return Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=price,
+            discount=discount,
+            rating=rating,
+            category=category,
+            user=self.user,
+        )
+
+    def ids(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product["id"] for product in response.data["results"]]
+
+    def test_filters(self):
+        self.assertEqual(
+            self.ids(category=self.phones.id),
+            [self.middle.id, self.cheap.id],
+        )
+        self.assertEqual(
+            self.ids(price_min=100, price_max=1000), [self.middle.id]
+        )
+        self.assertEqual(
+            self.ids(min_rating=4), [self.expensive.id, self.middle.id]
+        )
+        self.assertEqual(self.ids(on_sale="true"), [self.middle.id])
+        self.assertEqual(
+            self.ids(category=self.phones.id, min_rating=4), [self.middle.id]
+        )
+
+    def test_price_with_discount(self):
+        discounted = self.create_product(self.laptops, 1100, discount=20)
+        self.assertEqual(
+            self.ids(price_min=800, price_max=1000), [discounted.id]
+        )
+        self.assertEqual(
+            self.ids(ordering="-price")[1:3], [discounted.id, self.middle.id]
+        )
+
+    def test_ordering(self):
+        self.assertEqual(
+            self.ids(ordering="price"),
+            [self.cheap.id, self.middle.id, self.expensive.id],
+        )
+        self.assertEqual(
+            self.ids(ordering="-rating"),
+            [self.middle.id, self.expensive.id, self.cheap.id],
+        )
+
+    def rate(self, product, *rates):
+        for i, rate in enumerate(rates):
+            user = User.objects.create(username=f"rater {product.id} {i}")
+            Comment.objects.create(
+                product=product, content="1", rate=rate, user=user
+            )
+
+    def walk(self, **params):
+        response = self.client.get(self.url, params)
+        ids = [product["id"] for product in response.data["results"]]
+        for _ in range(10):
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+            ids += [product["id"] for product in response.data["results"]]
+        return ids
+
+    def test_rating_pagination_with_repeating_average(self):
+        self.rate(self.cheap, 5, 5, 4)
+        self.cheap.refresh_from_db()
+        self.assertEqual(self.cheap.rating, Decimal("4.67"))
+        self.assertEqual(
+            self.walk(ordering="-rating", page_size=1),
+            [self.middle.id, self.cheap.id, self.expensive.id],
+        )
+        self.assertEqual(
+            self.ids(min_rating=4.67), [self.middle.id, self.cheap.id]
+        )
+
+    def test_rating_pagination_through_ties(self):
+        for product in (self.cheap, self.expensive):
+            self.rate(product, 5, 5, 4)
+        tied = self.create_product(self.laptops, 100)
+        self.rate(tied, 4, 5, 5)
+        self.assertEqual(
+            self.walk(ordering="-rating", page_size=2),
+            [self.middle.id, tied.id, self.expensive.id, self.cheap.id],
+        )
+        self.assertEqual(
+            self.walk(ordering="rating", page_size=2),
+            [self.cheap.id, self.expensive.id, tied.id, self.middle.id],
+        )
+
+    def test_ordering_pagination(self):
+        response = self.client.get(
+            self.url, {"ordering": "-price", "page_size": 2}
+        )
+        ids = [product["id"] for product in response.data["results"]]
+        response = self.client.get(response.data["next"])
+        ids += [product["id"] for product in response.data["results"]]
+        self.assertEqual(
+            ids, [self.expensive.id, self.middle.id, self.cheap.id]
+        )
+
+    def test_invalid_params(self):
+        for params in (
+            {"category": "x"},
+            {"price_min": 10, "price_max": 5},
+            {"min_rating": 6},
+            {"ordering": "title"},
+        ):
+            response = self.client.get(self.url, params)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, params
+            )
+
+    def test_facets(self):
+        self.assertNotIn("facets", self.client.get(self.url).data)
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, {"facets": "true"})
+        facets = response.data["facets"]
+        self.assertEqual(
+            facets["category"],
+            [
+                {"id": self.phones.id, "count": 2},
+                {"id": self.laptops.id, "count": 1},
+            ],
+        )
+        self.assertEqual(
+            [bucket["count"] for bucket in facets["price"]],
+            [1, 0, 1, 0, 0, 1],
+        )
+        self.assertEqual(
+            facets["price"][0], {"min": None, "max": 100, "count": 1}
+        )
+
+    def test_facets_follow_filters(self):
+        response = self.client.get(
+            self.url, {"facets": "true", "min_rating": 4}
+        )
+        self.assertEqual(
+            [bucket["count"] for bucket in response.data["facets"]["price"]],
+            [0, 0, 1, 0, 0, 1],
+        )
+
+
+class CatalogCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title="123", description="123")
+        self.user = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.client_user = User.objects.create(
+            username="mint2", password="12345"
+        )
+        self.admin = User.objects.create(
+            username="mint3", password="12345", is_staff=True
+        )
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+
+    def test_product_list_served_from_cache(self):
+        url = reverse("products-list")
+        self.client.get(url)
+        # Only the validators of the conditional response are queried
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_product_change_invalidates_list_and_detail(self):
+        list_url = reverse("products-list")
+        detail_url = reverse("product-detail", args=(self.product.id,))
+        self.client.get(list_url)
+        self.client.get(detail_url)
+        self.product.title = "Pixel"
+        self.product.save()
+        response = self.client.get(list_url)
+        self.assertEqual(response.data["results"][0]["title"], "Pixel")
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data["title"], "Pixel")
+
+    def test_picture_change_invalidates_product(self):
+        detail_url = reverse("product-detail", args=(self.product.id,))
+        pictures_url = reverse("products-pictures", args=(self.product.id,))
+        self.client.get(detail_url)
+        self.client.get(pictures_url)
+        ProductPicture.objects.create(product=self.product, picture="1.jpg")
+        self.assertEqual(len(self.client.get(detail_url).data["pictures"]), 1)
+        self.assertEqual(len(self.client.get(pictures_url).data), 1)
+
+    def test_comment_rate_invalidates_product(self):
+        detail_url = reverse("product-detail", args=(self.product.id,))
+        self.client.get(detail_url)
+        Comment.objects.create(
+            product=self.product, content="1", rate=4, user=self.client_user
+        )
+        self.assertEqual(self.client.get(detail_url).data["rating"], "4.00")
+
+    def test_category_change_invalidates_categories(self):
+        url = reverse("categories-list")
+        self.client.get(url)
+        Category.objects.create(title="qwf", description="123")
+        self.assertEqual(len(self.client.get(url).data), 2)
+
+    def test_cache_stats(self):
+        url = reverse("categories-list")
+        self.client.get(url)
+        self.client.get(url)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("catalog-cache-stats"))
+        self.assertEqual(response.data["hits"], 1)
+        self.assertEqual(response.data["misses"], 1)
+
+    def test_cache_stats_not_admin(self):
+        self.client.force_authenticate(self.client_user)
+        response = self.client.get(reverse("catalog-cache-stats"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title="123", description="123")
+        self.user = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+
+    def test_if_none_match(self):
+        url = reverse("product-detail", args=(self.product.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+    def test_if_modified_since(self):
+        url = reverse("categories-list")
+        response = self.client.get(url)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_change_updates_etag(self):
+        url = reverse("product-detail", args=(self.product.id,))
+        etag = self.client.get(url)["ETag"]
+        self.product.title = "Iphone 2"
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_delete_updates_list_etag(self):
+        url = reverse("products-list")
+        Product.objects.create(
+            title="Iphone 2",
+            description="Iphone_x",
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+        etag = self.client.get(url)["ETag"]
+        self.product.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_list_validators_do_not_count_rows(self):
+        url = reverse("products-list")
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+        self.assertIn("myshop_collectionrevision", queries[0]["sql"])
+        self.assertNotIn("COUNT(", queries[0]["sql"])
+
+    def test_delete_seen_by_other_workers(self):
+        url = reverse("products-list")
+        Product.objects.create(
+            title="Iphone 2",
+            description="Iphone_x",
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+        etag = self.client.get(url)["ETag"]
+        # Caches of other workers see no invalidation
+        with mock.patch("myshop.cache._bump_generations"):
+            self.product.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_picture_change_updates_product_etag(self):
+        url = reverse("products-pictures", args=(self.product.id,))
+        etag = self.client.get(url)["ETag"]
+        ProductPicture.objects.create(product=self.product, picture="1.jpg")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_depends_on_query(self):
+        url = reverse("products-list")
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(
+            url, {"page_size": 1}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_product(self):
+        url = reverse("product-detail", args=(self.product.id + 1,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("ETag", response)
+
+
+class ProductSearchViewTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title="123", description="123")
+        self.user = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.url = reverse("products-search")
+
+    def create_product(self, title, description="Phone"):
+        return Product.objects.create(
+            title=title,
+            description=description,
+            price=12345,
+            category=self.category,
+            user=self.user,
+        )
+
+    def search(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_search(self):
+        iphone = self.create_product("Iphone", "Apple smartphone")
+        self.create_product("Galaxy", "Samsung smartphone")
+        response = self.search(q="apple")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            [iphone.id],
+        )
+
+    def test_search_all_words(self):
+        iphone = self.create_product("Iphone", "Apple smartphone")
+        self.create_product("Macbook", "Apple laptop")
+        response = self.search(q="Apple, smartphone!")
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            [iphone.id],
+        )
+
+    def test_ranking(self):
+        other = self.create_product("Case", "Case for a phone, not a phone")
+        best = self.create_product("Phone", "Phone")
+        response = self.search(q="phone")
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            [best.id, other.id],
+        )
+
+    def test_index_follows_changes(self):
+        product = self.create_product("Iphone")
+        product.title = "Galaxy"
+        product.save()
+        self.assertEqual(self.search(q="iphone").data["results"], [])
+        self.assertEqual(len(self.search(q="galaxy").data["results"]), 1)
+        product.delete()
+        self.assertEqual(self.search(q="galaxy").data["results"], [])
+
+    def test_pagination(self):
+        ids = {self.create_product(f"Iphone {i}").id for i in range(5)}
+        found = []
+        response = self.search(q="iphone", page_size=2)
+        while True:
+            found += [product["id"] for product in response.data["results"]]
+            if response.data["next"] is None:
+                break
+            response = self.client.get(response.data["next"])
+        self.assertEqual(len(found), 5)
+        self.assertEqual(set(found), ids)
+
+    def test_pagination_of_tied_ranks(self):
+        products = [self.create_product("Iphone") for _ in range(5)]
+        found = []
+        response = self.search(q="iphone", page_size=2)
+        while True:
+            found += [product["id"] for product in response.data["results"]]
+            if response.data["next"] is None:
+                break
+            response = self.client.get(response.data["next"])
+        self.assertEqual(found, [product.id for product in products])
+
+    def test_empty_query(self):
+        self.assertEqual(
+            self.search(q=" ").status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(self.search(q="**").data["results"], [])
+
+    def test_invalid_cursor(self):
+        response = self.search(q="iphone", cursor="cD1xd2Y=")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # "p=nan 1" and "p=x 1"
+        for cursor in ("cD1uYW4gMQ==", "cD14IDE="):
+            response = self.search(q="iphone", cursor=cursor)
+            self.assertEqual(
+                response.status_code, status.HTTP_404_NOT_FOUND, cursor
+            )
+
+
+class ProductAutocompleteViewTest(APITestCase):
+    def setUp(self):
+        autocomplete.reset()
+        self.category = Category.objects.create(
+            title="Phones", description="123"
+        )
+        self.user = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.url = reverse("products-autocomplete")
+
+    def create_product(self, title, rating=0):
+        return Product.objects.create(
+            title=title,
+            description="Phone",
+            price=12345,
+            rating=rating,
+            category=self.category,
+            user=self.user,
+        )
+
+    def test_autocomplete(self):
+        iphone = self.create_product("Iphone 13", rating=4)
+        best = self.create_product("Iphone 12", rating=5)
+        self.create_product("Galaxy")
+        response = self.client.get(self.url, {"prefix": "iph"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["products"],
+            [
+                {"id": best.id, "title": "Iphone 12"},
+                {"id": iphone.id, "title": "Iphone 13"},
+            ],
+        )
+        response = self.client.get(self.url, {"prefix": "pho"})
+        self.assertEqual(
+            response.data["categories"],
+            [{"id": self.category.id, "title": "Phones"}],
+        )
+
+    def test_limit(self):
+        for i in range(3):
+            self.create_product(f"Iphone {i}")
+        response = self.client.get(self.url, {"prefix": "iph", "limit": 2})
+        self.assertEqual(len(response.data["products"]), 2)
+        response = self.client.get(self.url, {"prefix": "iph", "limit": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_signals_update_index(self):
+        product = self.create_product("Iphone")
+        self.client.get(self.url, {"prefix": "iph"})
+        with self.captureOnCommitCallbacks(execute=True):
+            product.title = "Galaxy"
+            product.save()
+        response = self.client.get(self.url, {"prefix": "iph"})
+        self.assertEqual(response.data["products"], [])
+        response = self.client.get(self.url, {"prefix": "gal"})
+        self.assertEqual(len(response.data["products"]), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        response = self.client.get(self.url, {"prefix": "gal"})
+        self.assertEqual(response.data["products"], [])
+
+    def test_category_save_counts_no_products(self):
+        self.client.get(self.url, {"prefix": "pho"})
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                self.category.title = "Smartphones"
+                self.category.save()
+        response = self.client.get(self.url, {"prefix": "sma"})
+        self.assertEqual(
+            response.data["categories"],
+            [{"id": self.category.id, "title": "Smartphones"}],
+        )
+
+    def test_search_holds_index_lock(self):
+        self.create_product("Iphone")
+        search = autocomplete.PrefixIndex.search
+        locked = []
+
+        def search_locked(index, *args):
+            # Index updates of signals and rebuilds hold the same lock
+            locked.append(autocomplete._lock._is_owned())
+            return search(index, *args)
+
+        with mock.patch.object(
+            autocomplete.PrefixIndex, "search", search_locked
+        ):
+            response = self.client.get(self.url, {"prefix": "iph"})
+        self.assertEqual(len(response.data["products"]), 1)
+        self.assertEqual(locked, [True, True])
+
+    def test_empty_prefix(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {"prefix": " "})
+        self.assertEqual(response.data, {"products": [], "categories": []})
+
+
 class ProductDetailViewTest(APITestCase):
     def setUp(self):
         self.category = Category.objects.create(title="123", description="123")
@@ -224,6 +901,70 @@ class CommentsViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class CommentThreadsViewTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title="123", description="123")
+        self.user1 = User.objects.create(
+            username="mint", password="12345", is_supplier=True
+        )
+        self.user2 = User.objects.create(username="mint2", password="12345")
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=12345,
+            category=self.category,
+            user=self.user1,
+        )
+
+    def create_thread(self, depth):
+        comment = Comment.objects.create(
+            product=self.product, content="0", rate=5, user=self.user2
+        )
+        root = comment
+        for level in range(1, depth + 1):
+            comment = Comment.objects.create(
+                product=self.product,
+                content=str(level),
+                comment_of_reply=comment,
+                user=self.user2,
+            )
+        return root
+
+    def test_thread_is_nested(self):
+        root = self.create_thread(2)
+        url = reverse("comments-of-product", args=(self.product.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        thread = response.data["results"][0]
+        self.assertEqual(thread["id"], root.id)
+        self.assertEqual(thread["replies"][0]["content"], "1")
+        self.assertEqual(thread["replies"][0]["replies"][0]["content"], "2")
+        self.assertEqual(thread["replies"][0]["replies"][0]["replies"], [])
+
+    def test_thread_query_count_is_flat(self):
+        url = reverse("comments-of-product", args=(self.product.id,))
+        self.create_thread(1)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        self.create_thread(5)
+        self.create_thread(3)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_thread_depth_limit(self):
+        self.create_thread(3)
+        url = reverse("comments-of-product", args=(self.product.id,))
+        response = self.client.get(url, {"depth": 1})
+        thread = response.data["results"][0]
+        self.assertEqual(thread["replies"][0]["replies"], [])
+
+    def test_thread_invalid_depth(self):
+        url = reverse("comments-of-product", args=(self.product.id,))
+        response = self.client.get(url, {"depth": "deep"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class CommentDetailViewTest(APITestCase):
     def setUp(self):
         self.category = Category.objects.create(title="123", description="123")
@@ -347,6 +1088,15 @@ class CartViewTest(APITestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_post_cart_item_zero_quantity(self):
+        url = reverse("cart")
+        self.client.force_authenticate(self.user2)
+        data = {"product": self.product.id, "quantity": 0}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("quantity", response.data)
+        self.assertFalse(CartItem.objects.exists())
+
     def test_post_cart_item_supplier(self):
         url = reverse("cart")
         self.client.force_authenticate(self.user1)
@@ -448,27 +1198,24 @@ class OrderCreateViewTest(APITestCase):
         self.user2 = User.objects.create(
             username="mint2", password="12345", is_supplier=True
         )
-        self.product = Product.objects.create(
-            title="Iphone",
-            description="Iphone_x",
-            price=12345,
-            category=self.category,
-            user=self.user1,
-        )
-        self.cart_item1 = CartItem.objects.create(
-            product=self.product, user=self.user1, quantity=5
-        )
-        self.cart_item2 = CartItem.objects.create(
-            product=self.product, user=self.user1, quantity=5
-        )
-        self.cart_item3 = CartItem.objects.create(
-            product=self.product, user=self.user1, quantity=5
-        )
-        self.cart_item4 = CartItem.objects.create(
-            product=self.product, user=self.user1, quantity=5
-        )
+        self.products = [
+            Product.objects.create(
+                title="Iphone",
+                description="Iphone_x",
+                price=12345,
+                category=self.category,
+                user=self.user1,
+            )
+            for _ in range(4)
+        ]
+        self.cart_item1, self.cart_item2, self.cart_item3, self.cart_item4 = [
+            CartItem.objects.create(
+                product=product, user=self.user1, quantity=5
+            )
+            for product in self.products
+        ]
         self.cart_item5 = CartItem.objects.create(
-            product=self.product, user=self.user2, quantity=5
+            product=self.products[0], user=self.user2, quantity=5
         )
         self.promocode = Promocode.objects.create(code="twenty", discount=20)
 
@@ -495,6 +1242,16 @@ class OrderCreateViewTest(APITestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_create_order_with_some_not_own_cart_items(self):
+        url = reverse("checkout-cart")
+        self.client.force_authenticate(self.user1)
+        data = {"ids": [self.cart_item1.id, self.cart_item5.id]}
+        with self.assertNumQueries(1):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(CartItem.objects.count(), 5)
+        self.assertEqual(Order.objects.count(), 0)
+
     def test_create_order_with_correct_promocode(self):
         url = reverse("checkout-cart")
         self.client.force_authenticate(self.user1)
@@ -521,6 +1278,296 @@ class OrderCreateViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class OrderCreateBulkTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title="123", description="123")
+        self.supplier = User.objects.create(
+            username="mint1", password="12345", is_supplier=True
+        )
+        self.user = User.objects.create(username="mint2", password="12345")
+        self.promocode = Promocode.objects.create(code="twenty", discount=20)
+
+    def create_cart_items(self, count):
+        cart_items = []
+        for i in range(count):
+            product = Product.objects.create(
+                title=f"Iphone {i}",
+                description="Iphone_x",
+                price=100,
+                category=self.category,
+                user=self.supplier,
+            )
+            cart_items.append(
+                CartItem.objects.create(
+                    product=product, user=self.user, quantity=2
+                )
+            )
+        return [cart_item.id for cart_item in cart_items]
+
+    def test_checkout_query_count_is_flat(self):
+        url = reverse("checkout-cart")
+        self.client.force_authenticate(self.user)
+        ids = self.create_cart_items(2)
+        with self.assertNumQueries(13):
+            self.client.post(url, {"ids": ids}, format="json")
+        ids = self.create_cart_items(20)
+        with self.assertNumQueries(13):
+            response = self.client.post(url, {"ids": ids}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["order_items"]), 20)
+        self.assertEqual(CartItem.objects.count(), 0)
+
+    def test_checkout_saves_discounted_price(self):
+        url = reverse("checkout-cart")
+        self.client.force_authenticate(self.user)
+        ids = self.create_cart_items(3)
+        data = {"ids": ids, "promocode": "twenty"}
+        response = self.client.post(url, data, format="json")
+        order = Order.objects.get(id=response.data["id"])
+        self.assertEqual(order.price, 600)
+        self.assertEqual(order.price_with_discount, 480)
+
+    def test_checkout_with_incorrect_promocode_creates_nothing(self):
+        url = reverse("checkout-cart")
+        self.client.force_authenticate(self.user)
+        ids = self.create_cart_items(3)
+        data = {"ids": ids, "promocode": "123"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(OrderItem.objects.count(), 0)
+        self.assertEqual(CartItem.objects.count(), 3)
+
+
+class OrderCreateIdempotencyTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title="123", description="123")
+        self.supplier = User.objects.create(
+            username="mint1", password="12345", is_supplier=True
+        )
+        self.user = User.objects.create(username="mint2", password="12345")
+        self.product = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=100,
+            category=self.category,
+            user=self.supplier,
+        )
+        self.cart_item = CartItem.objects.create(
+            product=self.product, user=self.user, quantity=2
+        )
+        self.url = reverse("checkout-cart")
+        self.client.force_authenticate(self.user)
+
+    def test_retry_returns_original_order(self):
+        data = {"ids": [self.cart_item.id]}
+        response1 = self.client.post(
+            self.url, data, format="json", HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+        response2 = self.client.post(
+            self.url, data, format="json", HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+        self.assertEqual(response1.status_code, status.HTTP_200_OK)
+        self.assertEqual(response2.status_code, status.HTTP_200_OK)
+        self.assertEqual(response1.data["id"], response2.data["id"])
+        self.assertEqual(response2["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_concurrent_retry_replays_winner(self):
+        data = {"ids": [self.cart_item.id]}
+        stored_response = views.stored_response
+        atomic = transaction.atomic
+        winner = {}
+
+        def winner_commits(*args, **kwargs):
+            # The retry read the cart, then the first request committed
+            if not winner:
+                winner["response"] = None
+                winner["response"] = self.client.post(
+                    self.url,
+                    data,
+                    format="json",
+                    HTTP_IDEMPOTENCY_KEY="key-1",
+                )
+            return atomic(*args, **kwargs)
+
+        with mock.patch.object(
+            views,
+            "stored_response",
+            side_effect=[None, mock.DEFAULT, mock.DEFAULT],
+            wraps=stored_response,
+        ), mock.patch.object(
+            views, "transaction", mock.Mock(atomic=winner_commits)
+        ):
+            retry = self.client.post(
+                self.url, data, format="json", HTTP_IDEMPOTENCY_KEY="key-1"
+            )
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data["id"], winner["response"].data["id"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_other_request(self):
+        self.client.post(
+            self.url,
+            {"ids": [self.cart_item.id]},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="key-1",
+        )
+        response = self.client.post(
+            self.url,
+            {"ids": [self.cart_item.id, 123]},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="key-1",
+        )
+        self.assertEqual(
+            response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+
+    def test_expired_key_is_evicted(self):
+        self.client.post(
+            self.url,
+            {"ids": [self.cart_item.id]},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="key-1",
+        )
+        IdempotencyKey.objects.update(
+            creation_date=timezone.now() - timedelta(days=2)
+        )
+        cart_item = CartItem.objects.create(
+            product=self.product, user=self.user, quantity=1
+        )
+        response = self.client.post(
+            self.url,
+            {"ids": [cart_item.id]},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="key-1",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_failed_checkout_is_not_stored(self):
+        response = self.client.post(
+            self.url,
+            {"ids": [self.cart_item.id], "promocode": "123"},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="key-1",
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(IdempotencyKey.objects.count(), 0)
+
+    def test_too_long_key(self):
+        response = self.client.post(
+            self.url,
+            {"ids": [self.cart_item.id]},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="k" * 256,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderCreateStockTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title="123", description="123")
+        self.supplier = User.objects.create(
+            username="mint1", password="12345", is_supplier=True
+        )
+        self.user = User.objects.create(username="mint2", password="12345")
+        self.product1 = Product.objects.create(
+            title="Iphone",
+            description="Iphone_x",
+            price=100,
+            category=self.category,
+            user=self.supplier,
+            stock=3,
+        )
+        self.product2 = Product.objects.create(
+            title="Pixel",
+            description="Pixel",
+            price=100,
+            category=self.category,
+            user=self.supplier,
+        )
+        self.url = reverse("checkout-cart")
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, *items):
+        ids = [
+            CartItem.objects.create(
+                product=product, user=self.user, quantity=quantity
+            ).id
+            for product, quantity in items
+        ]
+        return self.client.post(self.url, {"ids": ids}, format="json")
+
+    def test_checkout_reserves_stock(self):
+        response = self.checkout((self.product1, 2), (self.product2, 5))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Product.objects.get(id=self.product1.id).stock, 1)
+        self.assertIsNone(Product.objects.get(id=self.product2.id).stock)
+
+    def test_stock_is_reserved_last(self):
+        cart_item = CartItem.objects.create(
+            product=self.product1, user=self.user, quantity=1
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url,
+                {"ids": [cart_item.id]},
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="key-1",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statements = [query["sql"] for query in queries]
+        reserved = max(
+            index
+            for index, sql in enumerate(statements)
+            if sql.startswith('UPDATE "myshop_product" SET "stock"')
+        )
+        # Product rows stay locked only until the transaction ends
+        self.assertTrue(
+            all(
+                sql.startswith("RELEASE SAVEPOINT")
+                for sql in statements[reserved + 1:]
+            ),
+            statements[reserved + 1:],
+        )
+
+    def test_total_is_read_with_items_locked(self):
+        cart_item = CartItem.objects.create(
+            product=self.product1, user=self.user, quantity=2
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url, {"ids": [cart_item.id]}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statements = [query["sql"] for query in queries]
+        began = next(
+            index
+            for index, sql in enumerate(statements)
+            if sql.startswith("SAVEPOINT")
+        )
+        summed = next(
+            index
+            for index, sql in enumerate(statements)
+            if "SUM(" in sql
+        )
+        self.assertLess(began, summed)
+        order = Order.objects.get()
+        self.assertEqual(order.price, self.product1.price * 2)
+
+    def test_checkout_sold_out(self):
+        self.checkout((self.product1, 2))
+        response = self.checkout((self.product1, 2), (self.product2, 1))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["products"], [self.product1.id])
+        self.assertEqual(Product.objects.get(id=self.product1.id).stock, 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(CartItem.objects.count(), 2)
+
+
 class CategoriesViewTest(APITestCase):
     def setUp(self):
         self.category = Category.objects.create(title="123", description="123")
@@ -0,0 +1,200 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .cache import invalidate_products
+from .imaging import render_variants
+from .models import Product, ProductPicture
+from .storage import PICTURES_DIR, picture_storage
+
+logger = logging.getLogger(__name__)
+
+# Variants are rendered by a pool of processes, so resizing does not hold
+# the GIL of the web workers. A few threads feed the pool: they read the
+# original, wait for its variants and save them next to it.
+_processes = None
+_threads = None
+
+
+def _pools():
+    global _processes, _threads
+    if _processes is None:
+        _processes = ProcessPoolExecutor(
+            settings.PICTURE_VARIANTS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        _threads = ThreadPoolExecutor(settings.PICTURE_VARIANTS_WORKERS)
+    return _processes, _threads
+
+
+def variant_name(name, variant):
+    root, _ = os.path.splitext(name)
+    return f"{root}_{variant}.webp"
+
+
+def generate_variants(picture, render=render_variants):
+    """Render the variants of picture, save them and record them in
+    picture.variants. render runs the resizing, e.g. in another process.
+    """
+    with picture.picture.open("rb") as original:
+        data = original.read()
+    rendered = render(
+        data, settings.PICTURE_VARIANTS, settings.PICTURE_VARIANTS_QUALITY
+    )
+
+    # Named after the original, so pictures sharing a file share variants
+    variants = {}
+    for variant, content in rendered.items():
+        name = variant_name(picture.picture.name, variant)
+        variants[variant] = picture_storage.replace(name, ContentFile(content))
+    _record_variants(picture, variants)
+    return variants
+
+
+def _record_variants(picture, variants):
+    now = timezone.now()
+    ProductPicture.objects.filter(pk=picture.pk).update(
+        variants=variants, updated_at=now
+    )
+    Product.objects.filter(pk=picture.product_id).update(updated_at=now)
+    invalidate_products(picture.product_id)
+    picture.variants = variants
+
+
+def _shared_variants(picture):
+    """Variants of another picture with the same file, if any"""
+    return (
+        ProductPicture.objects.filter(picture=picture.picture.name)
+        .exclude(pk=picture.pk)
+        .exclude(variants={})
+        .values_list("variants", flat=True)
+        .first()
+    )
+
+
+def _generate(picture_id, render=render_variants, reuse=True):
+    try:
+        picture = ProductPicture.objects.filter(pk=picture_id).first()
+        if picture is None or not picture.picture:
+            return True
+        variants = _shared_variants(picture) if reuse else None
+        if variants:
+            _record_variants(picture, variants)
+        else:
+            generate_variants(picture, render)
+        return True
+    except Exception:
+        logger.exception("Variants of picture %s failed", picture_id)
+        return False
+
+
+def _generate_in_thread(picture_id, processes, reuse):
+    close_old_connections()
+    try:
+        return _generate(
+            picture_id,
+            lambda *args: processes.submit(render_variants, *args).result(),
+            reuse,
+        )
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(picture_id, reuse=True):
+    """Generate variants of a picture in the background.
+
+    Variants already generated for the same file by another picture are
+    reused unless reuse is False. Returns a future of whether it
+    succeeded, which is already done when PICTURE_VARIANTS_SYNC is set.
+    """
+    if settings.PICTURE_VARIANTS_SYNC:
+        future = Future()
+        future.set_result(_generate(picture_id, reuse=reuse))
+        return future
+
+    processes, threads = _pools()
+    return threads.submit(_generate_in_thread, picture_id, processes, reuse)
+
+
+# Suffix of files moved aside by delete_unreferenced_files
+TRASH_SUFFIX = ".unreferenced"
+
+
+def _referenced_files():
+    names = set()
+    for name, variants in ProductPicture.objects.values_list(
+        "picture", "variants"
+    ).iterator():
+        names.add(name)
+        names.update(variants.values())
+    return names
+
+
+def delete_unreferenced_files(min_age):
+    """Delete picture files and variants which no picture references and
+    which were not saved for min_age seconds. Returns their number.
+
+    Files are shared by pictures of the same content, so an upload may
+    reuse a file while it is collected. Candidates are first moved aside
+    and then checked again: an upload reusing one before that refreshed
+    its modification time or is referenced by now, and one after that
+    finds no file and writes it again.
+    """
+    cutoff = time.time() - min_age
+    referenced = _referenced_files()
+    candidates = set()
+    root = picture_storage.path(PICTURES_DIR)
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if path.endswith(TRASH_SUFFIX):
+                # Left by an interrupted run
+                candidates.add(path[: -len(TRASH_SUFFIX)])
+                continue
+            name = os.path.relpath(path, picture_storage.location)
+            if name.replace(os.sep, "/") in referenced:
+                continue
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+                os.rename(path, path + TRASH_SUFFIX)
+            except FileNotFoundError:
+                continue
+            candidates.add(path)
+
+    referenced = _referenced_files()
+    deleted = 0
+    for path in candidates:
+        name = os.path.relpath(path, picture_storage.location)
+        try:
+            if (
+                name.replace(os.sep, "/") in referenced
+                or os.stat(path + TRASH_SUFFIX).st_mtime > cutoff
+            ):
+                os.replace(path + TRASH_SUFFIX, path)
+            else:
+                os.remove(path + TRASH_SUFFIX)
+                deleted += 1
+        except OSError:
+            logger.exception("Could not delete picture file %s", name)
+    return deleted
+
+
+@receiver(post_save, sender=ProductPicture)
+def picture_uploaded(sender, instance, created, update_fields, **kwargs):
+    if not instance.picture or (
+        update_fields and "picture" not in update_fields
+    ):
+        return
+    transaction.on_commit(lambda: schedule_variants(instance.pk))
@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .cache import invalidate_products
+from .imaging import format_extension, verify_image
+from .models import Product, ProductPicture
+from .storage import picture_storage
+from .thumbnails import schedule_variants
+
+# Uploaded files are streamed to temporary files by the upload handlers,
+# so verifying a picture reads it back from disk. Pictures of one request
+# are verified by a pool of threads, Pillow decodes without the GIL.
+_threads = None
+
+
+def _pool():
+    global _threads
+    if _threads is None:
+        _threads = ThreadPoolExecutor(settings.PICTURE_UPLOAD_WORKERS)
+    return _threads
+
+
+def _verify(file):
+    # Like Django's ImageField, the format found is kept on the file so the
+    # stored name doesn't have to trust the client's extension.
+    path = getattr(file, "temporary_file_path", None)
+    try:
+        if path is not None:
+            file.image_format = verify_image(path())
+        else:
+            file.seek(0)
+            file.image_format = verify_image(file)
+            file.seek(0)
+    except Exception:
+        return False
+    return True
+
+
+def _picture_name(field, file):
+    if getattr(file, "image_format", None) is None and not _verify(file):
+        raise ValueError(f"{file.name} is not a valid image")
+    name = os.path.splitext(os.path.basename(file.name))[0]
+    return field.generate_filename(
+        None, name + format_extension(file.image_format)
+    )
+
+
+def invalid_pictures(files):
+    """Indexes of files which are not valid images"""
+    valid = _pool().map(_verify, files)
+    return [index for index, ok in enumerate(valid) if not ok]
+
+
+def add_pictures(product, files):
+    """Store files and add them to product as pictures with one insert.
+
+    Stored names get the extension of the format the files were verified
+    as, whatever the client named them.
+
+    Does what saving each picture would have done in its signals: the
+    product is marked as changed and variants are scheduled on commit.
+    """
+    field = ProductPicture._meta.get_field("picture")
+    pictures = [
+        ProductPicture(
+            product=product,
+            picture=picture_storage.save(_picture_name(field, file), file),
+        )
+        for file in files
+    ]
+    with transaction.atomic():
+        pictures = ProductPicture.objects.bulk_create(pictures)
+        Product.objects.filter(pk=product.pk).update(
+            updated_at=timezone.now()
+        )
+        invalidate_products(product.pk)
+        picture_ids = [picture.pk for picture in pictures]
+        transaction.on_commit(
+            lambda: [schedule_variants(pk) for pk in picture_ids]
+        )
+    return pictures
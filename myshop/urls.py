@@ -3,17 +3,22 @@ from .views import (
     CategoriesView,
     CategoryDetailView,
     ProductsListView,
+    ProductSearchView,
+    ProductAutocompleteView,
     ProductDetailView,
     ProductPicturesListView,
+    ProductPicturesBulkView,
     ProductPictureDetailView,
     CommentsView,
     CommentDetailView,
     CartView,
+    CartBulkView,
     CartDetailView,
     OrderCreateView,
     OrderListView,
     PromocodeListView,
     PromocodeDetailView,
+    CatalogCacheStatsView,
 )
 
 
@@ -25,6 +30,16 @@ urlpatterns = [
         name="category-detail",
     ),
     path("products/", ProductsListView.as_view(), name="products-list"),
+    path(
+        "products/search/",
+        ProductSearchView.as_view(),
+        name="products-search",
+    ),
+    path(
+        "products/autocomplete/",
+        ProductAutocompleteView.as_view(),
+        name="products-autocomplete",
+    ),
     path(
         "products/<int:pk>/",
         ProductDetailView.as_view(),
@@ -35,6 +50,11 @@ urlpatterns = [
         ProductPicturesListView.as_view(),
         name="products-pictures",
     ),
+    path(
+        "products/<int:pk>/pictures/bulk/",
+        ProductPicturesBulkView.as_view(),
+        name="products-pictures-bulk",
+    ),
     path(
         "products/<int:pk>/pictures/<int:alt_pk>/",
         ProductPictureDetailView.as_view(),
@@ -51,6 +71,7 @@ urlpatterns = [
         name="comment-detail",
     ),
     path("cart/", CartView.as_view(), name="cart"),
+    path("cart/bulk/", CartBulkView.as_view(), name="cart-bulk"),
     path("cart/<int:pk>/", CartDetailView.as_view(), name="cart-detail"),
     path("cart/checkout/", OrderCreateView.as_view(), name="checkout-cart"),
     path("orders/", OrderListView.as_view(), name="orders"),
@@ -60,4 +81,9 @@ urlpatterns = [
         PromocodeDetailView.as_view(),
         name="promocode-detail",
     ),
+    path(
+        "cache/stats/",
+        CatalogCacheStatsView.as_view(),
+        name="catalog-cache-stats",
+    ),
 ]
@@ -1,8 +1,44 @@
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import IntegrityError, transaction
 from django.http import Http404
+from django.conf import settings
+from .authentication import RoleClaimsAuthenticationMixin
+from .autocomplete import autocomplete
+from .cache import cache_response, get_stats
+from .cart import apply_cart_operations, get_cart
+from .conditional import (
+    conditional_response,
+    row_validators,
+    collection_validators,
+)
+from .exceptions import CartChanged, EmptyCheckout, ProductSoldOut
+from .idempotency import (
+    claim_key,
+    get_idempotency_key,
+    is_valid_key,
+    stored_response,
+    store_response,
+)
+from .pagination import (
+    ProductCursorPagination,
+    ProductSearchPagination,
+    CommentThreadCursorPagination,
+)
+from .querysets import (
+    optimize_queryset,
+    attach_comment_replies,
+    filter_products,
+    product_facets,
+    cart_total,
+)
+from .search import search_products
+from .uploads import add_pictures
 from .permissions import (
+    QuerysetPermissionMixin,
     OwnerPermission,
     CartOwnerPermission,
     IsSupplierPermission,
@@ -19,19 +55,22 @@ from .models import (
     OrderItem,
     Order,
     Promocode,
+    reserve_stock,
 )
 from .serializers import (
     ProductSerializer,
-    CommentSerializer,
+    ProductFilterSerializer,
+    CommentThreadSerializer,
     CartItemSerializer,
     CategorySerializer,
-    CartSerializer,
     ProductCreateSerializer,
     PictureSerializer,
+    PictureUploadSerializer,
     CommentDetailSerializer,
     OrderSerializer,
     CommentPatchSerializer,
     CartPatchSerializer,
+    CartOperationSerializer,
     PromocodeSerializer,
 )
 from rest_framework.permissions import (
@@ -41,20 +80,45 @@ from rest_framework.permissions import (
 )
 
 
-def get_object(model, pk):
+def get_object(model, pk, queryset=None):
+    if queryset is None:
+        queryset = model.objects.all()
     try:
-        return model.objects.get(pk=pk)
+        return queryset.get(pk=pk)
     except model.DoesNotExist:
         raise Http404
 
 
-class ProductsListView(APIView):
+class ProductsListView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [IsAuthenticatedOrReadOnly, IsSupplierPermission]
 
+    @conditional_response(
+        lambda request: collection_validators(
+            Product.objects.all(), "products"
+        )
+    )
+    @cache_response("products")
     def get(self, request):
-        products = Product.objects.all()
+        filters = ProductFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(
+                filters.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = filter_products(
+            Product.objects.all(), filters.validated_data
+        )
+
+        paginator = ProductCursorPagination()
+        products = paginator.paginate_queryset(
+            optimize_queryset(queryset, ProductSerializer),
+            request,
+            view=self,
+        )
         serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        response = paginator.get_paginated_response(serializer.data)
+        if filters.validated_data.get("facets"):
+            response.data["facets"] = product_facets(queryset)
+        return response
 
     def post(self, request):
         serializer = ProductCreateSerializer(data=request.data)
@@ -64,22 +128,76 @@ class ProductsListView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProductDetailView(APIView):
+class ProductSearchView(RoleClaimsAuthenticationMixin, APIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    @cache_response("products")
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = ProductSearchPagination()
+        matches = paginator.paginate_search(
+            lambda after, limit: search_products(query, after, limit),
+            request,
+        )
+        products = optimize_queryset(
+            Product.objects.all(), ProductSerializer
+        ).in_bulk([product_id for _, product_id in matches])
+        serializer = ProductSerializer(
+            [
+                products[product_id]
+                for _, product_id in matches
+                if product_id in products
+            ],
+            many=True,
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ProductAutocompleteView(RoleClaimsAuthenticationMixin, APIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request):
+        try:
+            limit = int(
+                request.query_params.get("limit", settings.AUTOCOMPLETE_LIMIT)
+            )
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.AUTOCOMPLETE_LIMIT))
+
+        prefix = request.query_params.get("prefix", "")
+        if not prefix.strip():
+            return Response({"products": [], "categories": []})
+        return Response(autocomplete(prefix, limit))
+
+
+class ProductDetailView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [
         IsAuthenticatedOrReadOnly,
         OwnerPermission,
         IsSupplierPermission,
     ]
 
+    @conditional_response(
+        lambda request, pk: row_validators(Product.objects.all(), pk)
+    )
+    @cache_response("product:{pk}")
     def get(self, request, pk):
-        product = get_object(Product, pk)
+        product = get_object(
+            Product,
+            pk,
+            optimize_queryset(Product.objects.all(), ProductSerializer),
+        )
         serializer = ProductSerializer(product)
         return Response(serializer.data)
 
     def delete(self, request, pk):
         product = get_object(Product, pk)
         self.check_object_permissions(request, product)
-        if product.user != request.user:
+        if product.user_id != request.user.id:
             return Response(status=status.HTTP_403_FORBIDDEN)
         product.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -96,13 +214,17 @@ class ProductDetailView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProductPicturesListView(APIView):
+class ProductPicturesListView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [
         IsAuthenticatedOrReadOnly,
         OwnerPermission,
         IsSupplierPermission,
     ]
 
+    @conditional_response(
+        lambda request, pk: row_validators(Product.objects.all(), pk)
+    )
+    @cache_response("product:{pk}")
     def get(self, request, pk):
         pictures = ProductPicture.objects.filter(product=pk)
         serializer = PictureSerializer(pictures, many=True)
@@ -112,13 +234,35 @@ class ProductPicturesListView(APIView):
         product = get_object(Product, pk)
         self.check_object_permissions(request, product)
         picture = request.data["picture"]
-        ProductPicture.objects.create(
-            product=Product.objects.get(id=pk), picture=picture
-        )
+        ProductPicture.objects.create(product=product, picture=picture)
         return Response(status=status.HTTP_201_CREATED)
 
 
-class ProductPictureDetailView(APIView):
+class ProductPicturesBulkView(APIView):
+    """Add many pictures to a product in one request"""
+
+    permission_classes = [
+        IsAuthenticated,
+        OwnerPermission,
+        IsSupplierPermission,
+    ]
+
+    def post(self, request, pk):
+        product = get_object(Product, pk)
+        self.check_object_permissions(request, product)
+        serializer = PictureUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        pictures = add_pictures(product, serializer.validated_data["pictures"])
+        return Response(
+            PictureSerializer(pictures, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class ProductPictureDetailView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [
         IsAuthenticatedOrReadOnly,
         OwnerPermission,
@@ -138,9 +282,15 @@ class ProductPictureDetailView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CategoriesView(APIView):
+class CategoriesView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminUserOrReadOnly]
 
+    @conditional_response(
+        lambda request: collection_validators(
+            Category.objects.all(), "categories"
+        )
+    )
+    @cache_response("categories")
     def get(self, request):
         categories = Category.objects.all()
         serializer = CategorySerializer(categories, many=True)
@@ -154,9 +304,12 @@ class CategoriesView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CategoryDetailView(APIView):
+class CategoryDetailView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminUserOrReadOnly]
 
+    @conditional_response(
+        lambda request, pk: row_validators(Category.objects.all(), pk)
+    )
     def get(self, request, pk):
         category = get_object(Category, pk)
         serializer = CategorySerializer(category)
@@ -178,13 +331,27 @@ class CategoryDetailView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CommentsView(APIView):
+class CommentsView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [IsAuthenticatedOrReadOnly, IsClientPermission]
 
     def get(self, request, pk):
-        comments = Comment.objects.filter(comment_of_reply=None, product=pk)
-        serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        try:
+            depth = int(
+                request.query_params.get("depth", settings.COMMENTS_MAX_DEPTH)
+            )
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        depth = max(0, min(depth, settings.COMMENTS_MAX_DEPTH))
+
+        paginator = CommentThreadCursorPagination()
+        comments = paginator.paginate_queryset(
+            Comment.objects.filter(comment_of_reply=None, product=pk),
+            request,
+            view=self,
+        )
+        attach_comment_replies(comments, depth)
+        serializer = CommentThreadSerializer(comments, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request, pk):
         if request.data.get("rate") and request.data.get("comment_of_reply"):
@@ -198,7 +365,7 @@ class CommentsView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CommentDetailView(APIView):
+class CommentDetailView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [
         IsAuthenticatedOrReadOnly,
         OwnerPermission,
@@ -235,7 +402,7 @@ class CommentDetailView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CartView(APIView):
+class CartView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [
         IsAuthenticated,
         OwnerPermission,
@@ -243,19 +410,56 @@ class CartView(APIView):
     ]
 
     def get(self, request):
-        cart_items = CartItem.objects.filter(user=request.user)
-        serializer = CartSerializer({"products": cart_items})
-        return Response(serializer.data)
+        return Response(get_cart(request.user.id))
 
     def post(self, request):
         serializer = CartItemSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Adding a product already in the cart adds to its quantity
+            product = serializer.validated_data["product"]
+            apply_cart_operations(
+                request.user.id,
+                [
+                    {
+                        "product": product.id,
+                        "op": "add",
+                        "quantity": serializer.validated_data.get(
+                            "quantity", 1
+                        ),
+                    }
+                ],
+            )
+            cart_item = CartItem.objects.get(
+                user_id=request.user.id, product=product
+            )
+            return Response(
+                CartItemSerializer(cart_item).data,
+                status=status.HTTP_201_CREATED,
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CartDetailView(APIView):
+class CartBulkView(APIView):
+    """Add, set or remove many cart items in one transaction"""
+
+    permission_classes = [IsAuthenticated, ClientPermission]
+
+    def post(self, request):
+        serializer = CartOperationSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.CART_MAX_OPERATIONS,
+        )
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        apply_cart_operations(request.user.id, serializer.validated_data)
+        return Response(get_cart(request.user.id))
+
+
+class CartDetailView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [
         IsAuthenticated,
         CartOwnerPermission,
@@ -265,7 +469,7 @@ class CartDetailView(APIView):
     def get(self, request, pk):
         cart_item = get_object(CartItem, pk)
         self.check_object_permissions(request, cart_item)
-        if CartItem.objects.get(id=pk).user != request.user:
+        if cart_item.user_id != request.user.id:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
         serializer = CartItemSerializer(cart_item)
@@ -289,67 +493,113 @@ class CartDetailView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class OrderCreateView(APIView):
+class OrderCreateView(QuerysetPermissionMixin, APIView):
     permission_classes = [IsAuthenticated, CartOwnerPermission]
 
     def post(self, request):
+        idempotency_key = get_idempotency_key(request)
+        if idempotency_key is not None:
+            if not is_valid_key(idempotency_key):
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            response = stored_response(request, idempotency_key)
+            if response is not None:
+                return response
+
         if (
             not request.data.get("ids")
             or type(request.data.get("ids")) != list
         ):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        cart_items = CartItem.objects.filter(id__in=request.data["ids"])
-        if not cart_items:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-
-        for cart_item in cart_items:
-            self.check_object_permissions(request, cart_item)
-
-        serializer = CartSerializer({"products": cart_items})
-        order = Order.objects.create(
-            user=request.user,
-            price=serializer.data["total_price"],
-            price_with_discount=serializer.data["total_price"],
-        )
+        selected = CartItem.objects.filter(id__in=request.data["ids"])
+        self.check_queryset_permissions(request, selected)
 
+        promocode = None
         if request.data.get("promocode"):
             try:
                 promocode = Promocode.objects.get(
                     code=request.data.get("promocode")
                 )
-                order.price_with_discount = float(
-                    serializer.data["total_price"]
-                ) - (
-                    float(serializer.data["total_price"])
-                    * (promocode.discount / 100)
-                )
             except Promocode.DoesNotExist:
                 raise Http404
 
-        for cart_item in serializer.data["products"]:
-            OrderItem.objects.create(
-                product=Product.objects.get(id=cart_item["product"]),
-                order=order,
-                quantity=cart_item["quantity"],
-                price=cart_item["price"],
-            )
-        for cart_item in cart_items:
-            cart_item.delete()
-        sserializer = OrderSerializer(order)
-        return Response(sserializer.data)
+        try:
+            with transaction.atomic():
+                if idempotency_key is not None:
+                    claimed = claim_key(request, idempotency_key)
+                # Locked, so the total matches the items ordered
+                cart_items = list(selected.select_for_update())
+                if not cart_items:
+                    raise EmptyCheckout()
+                total_price = cart_total(selected)
+                price_with_discount = total_price
+                if promocode:
+                    price_with_discount = (
+                        total_price * (100 - promocode.discount) / 100
+                    ).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+                order = Order.objects.create(
+                    user=request.user,
+                    price=total_price,
+                    price_with_discount=price_with_discount,
+                )
+                OrderItem.objects.bulk_create(
+                    [
+                        OrderItem(
+                            product_id=cart_item.product_id,
+                            order=order,
+                            quantity=cart_item.quantity,
+                            price=cart_item.price,
+                        )
+                        for cart_item in cart_items
+                    ]
+                )
+                deleted, _ = CartItem.objects.filter(
+                    id__in=[cart_item.id for cart_item in cart_items]
+                ).delete()
+                if deleted != len(cart_items):
+                    # Another checkout took some of these items first
+                    raise CartChanged()
+                serializer = OrderSerializer(order)
+                if idempotency_key is not None:
+                    store_response(
+                        claimed, status.HTTP_200_OK, serializer.data
+                    )
+                quantities = defaultdict(int)
+                for cart_item in cart_items:
+                    quantities[cart_item.product_id] += cart_item.quantity
+                # Last, so the product rows are locked only until commit
+                sold_out = reserve_stock(quantities)
+                if sold_out:
+                    raise ProductSoldOut(sold_out)
+        except IntegrityError:
+            # A retry with the same key was committed first, this one
+            # waited for it on the unique index of keys
+            if idempotency_key is None:
+                raise
+            response = stored_response(request, idempotency_key)
+            if response is None:
+                raise
+            return response
+        return Response(serializer.data)
 
 
-class OrderListView(APIView):
+class OrderListView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [IsAuthenticated, ClientPermission]
 
     def get(self, request):
-        orders = Order.objects.filter(user=request.user)
+        orders = Order.objects.filter(user_id=request.user.id)
         serializer = OrderSerializer(orders, many=True)
         return Response(serializer.data)
 
 
-class PromocodeListView(APIView):
+class CatalogCacheStatsView(RoleClaimsAuthenticationMixin, APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class PromocodeListView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
@@ -365,7 +615,7 @@ class PromocodeListView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PromocodeDetailView(APIView):
+class PromocodeDetailView(RoleClaimsAuthenticationMixin, APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request, pk):
@@ -1,3 +1,4 @@
+import sys
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
@@ -82,6 +83,28 @@ DATABASES['default'].update(db_from_env)
 DATABASES['default']['CONN_MAX_AGE'] = 500
 
 
+# Catalog generations and carts are invalidated by the worker handling a
+# write, so the cache must be shared by all workers: the database one by
+# default (create its table with createcachetable). Tests use a per-process
+# cache instead.
+TESTING = sys.argv[1:2] == ['test']
+CACHES = {
+    'default': {
+        'BACKEND': config(
+            'CACHE_BACKEND',
+            default=(
+                'django.core.cache.backends.locmem.LocMemCache'
+                if TESTING
+                else 'django.core.cache.backends.db.DatabaseCache'
+            ),
+        ),
+        'LOCATION': config(
+            'CACHE_LOCATION', default='e-shop' if TESTING else 'myshop_cache'
+        ),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -118,10 +141,22 @@ USE_TZ = False
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
+# Hash uploads while streaming them to disk, for content-addressed pictures
+FILE_UPLOAD_HANDLERS = ['myshop.storage.HashingFileUploadHandler']
+
 STATIC_URL = 'media/static/'
 STATIC_ROOT = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR
+# "django" streams media files from gunicorn workers, "nginx" only answers
+# with X-Accel-Redirect to MEDIA_ACCEL_PREFIX (see nginx/docking_django.conf)
+MEDIA_SERVING = config('MEDIA_SERVING', default='django')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Directories of MEDIA_ROOT which may be served
+MEDIA_PUBLIC_DIRS = ['images/']
+DOMEN = config('DOMEN')
+# Absolute URL media files are served from, e.g. a CDN
+MEDIA_BASE_URL = config('MEDIA_BASE_URL', default=f'{DOMEN}/{MEDIA_URL}')
 
 
 
@@ -141,13 +176,79 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'myshop.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'myshop.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+PRODUCTS_PAGE_SIZE = config('PRODUCTS_PAGE_SIZE', default=20, cast=int)
+PRODUCTS_MAX_PAGE_SIZE = config(
+    'PRODUCTS_MAX_PAGE_SIZE', default=100, cast=int
+)
+# Upper bounds of the price buckets of product list facets
+PRODUCTS_PRICE_BUCKETS = config(
+    'PRODUCTS_PRICE_BUCKETS',
+    default='100,500,1000,5000,10000',
+    cast=lambda v: [int(s) for s in v.split(',')],
+)
+COMMENTS_PAGE_SIZE = config('COMMENTS_PAGE_SIZE', default=20, cast=int)
+COMMENTS_MAX_PAGE_SIZE = config(
+    'COMMENTS_MAX_PAGE_SIZE', default=100, cast=int
+)
+COMMENTS_MAX_DEPTH = config('COMMENTS_MAX_DEPTH', default=10, cast=int)
+
+# Resized WebP copies of product pictures ({variant: max side in pixels})
+PICTURE_VARIANTS = {'thumbnail': 200, 'medium': 800}
+PICTURE_VARIANTS_QUALITY = 80
+PICTURE_VARIANTS_WORKERS = config(
+    'PICTURE_VARIANTS_WORKERS', default=2, cast=int
+)
+# Generate variants in the request instead of the worker pool
+PICTURE_VARIANTS_SYNC = config(
+    'PICTURE_VARIANTS_SYNC', default=False, cast=bool
+)
+# Files accepted by one bulk upload, and threads verifying them
+PICTURE_UPLOAD_MAX_FILES = config(
+    'PICTURE_UPLOAD_MAX_FILES', default=20, cast=int
+)
+PICTURE_UPLOAD_WORKERS = config('PICTURE_UPLOAD_WORKERS', default=4, cast=int)
+
+AUTOCOMPLETE_LIMIT = config('AUTOCOMPLETE_LIMIT', default=10, cast=int)
+AUTOCOMPLETE_REBUILD_SECONDS = config(
+    'AUTOCOMPLETE_REBUILD_SECONDS', default=600, cast=int
+)
+
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# Serialized carts of users, see myshop/cart.py
+CART_CACHE_ALIAS = config('CART_CACHE_ALIAS', default='default')
+CART_CACHE_TIMEOUT = config('CART_CACHE_TIMEOUT', default=3600, cast=int)
+# Operations accepted by one bulk cart update
+CART_MAX_OPERATIONS = config('CART_MAX_OPERATIONS', default=100, cast=int)
+
+IDEMPOTENCY_KEY_TTL = timedelta(
+    hours=config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+)
+
+# Reads of the shop views trust the roles in tokens instead of loading the
+# user, see myshop.authentication.RoleClaimsAuthenticationMixin
+JWT_ROLE_CLAIMS = config('JWT_ROLE_CLAIMS', default=False, cast=bool)
+
 SIMPLE_JWT = {
    'AUTH_HEADER_TYPES': ('JWT',),
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': (
+        'myshop.authentication.RoleClaimsTokenObtainPairSerializer'
+    ),
 }
 
 DJOSER = {
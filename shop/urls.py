@@ -1,11 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.conf import settings
+from myshop.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('myshop.urls')),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')),
-]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', serve_media),
+]